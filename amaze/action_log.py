@@ -0,0 +1,93 @@
+'''
+Binary format for the actions of many levels.
+
+Actions are stored as int8 (dx, dy) pairs, one block per level in the order the levels were written. The blocks
+are followed by a table with the level number, offset and number of actions of every block, and a trailer with
+the number of levels. A level can be read without parsing the others by memory mapping its block.
+
+    magic | actions of level a | actions of level b | ... | table (level, offset, count) int64 | count int64 | magic
+'''
+import numpy as np
+
+MAGIC = b'AMZACT01'
+SUFFIX = '.alog'
+TRAILER_SIZE = 8 + len(MAGIC)
+
+
+def is_action_log(filename):
+    '''
+    :return: True if filename starts like an action log, other actions files are JSON
+    '''
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ActionLogWriter(object):
+    '''
+    Writes the actions of every level as soon as the level is finished, in any order
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        self.table = []
+
+    def write(self, level, actions):
+        actions = np.asarray(actions, dtype=np.int64).reshape(-1, 2)
+        assert np.all(np.abs(actions) <= 127), 'Actions must be within +- 127 to be stored as int8'
+        self.table.append((level, self.file.tell(), len(actions)))
+        self.file.write(actions.astype(np.int8).tobytes())
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(np.array(self.table, dtype=np.int64).reshape(-1, 3).tobytes())
+        self.file.write(np.int64(len(self.table)).tobytes())
+        self.file.write(MAGIC)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ActionLog(object):
+    '''
+    Read-only, memory mapped action log. Indexing gives {'level': level, 'actions': actions} like the entries
+    of a JSON actions file, where actions is an (N, 2) int8 view into the file.
+
+    Blocks containing -128 are rejected when read. The writer never stores it, and its absolute value does not
+    fit in int8, so range checks with np.abs on the view would let it pass.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = np.memmap(filename, dtype=np.int8, mode='r')
+        trailer = self.data[-TRAILER_SIZE:].tobytes()
+        assert self.data[:len(MAGIC)].tobytes() == MAGIC and trailer[8:] == MAGIC, \
+            f'{filename} is not a complete action log'
+        count = int(np.frombuffer(trailer[:8], dtype=np.int64)[0])
+        start = len(self.data) - TRAILER_SIZE - count * 24
+        self.table = np.frombuffer(self.data[start:start + count * 24].tobytes(), dtype=np.int64).reshape(count, 3)
+        self.index = {level: i for i, level in enumerate(self.table[:, 0].tolist())}
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, i):
+        level, offset, count = self.table[i].tolist()
+        actions = self.data[offset:offset + 2 * count].reshape(count, 2)
+        assert not np.any(actions == np.iinfo(np.int8).min), f'Actions of level {level} are out of range'
+        return {'level': level, 'actions': actions}
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def find(self, level):
+        '''
+        :return: the actions of level, None if the log does not contain the level
+        '''
+        if level not in self.index:
+            return None
+        return self[self.index[level]]['actions']
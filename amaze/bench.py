@@ -0,0 +1,184 @@
+'''
+Benchmarks of maze generation, the engine and the evaluator.
+
+Every benchmark is run warmup times untimed and then repeat times timed. The results can be stored as JSON
+and compared against a stored baseline, the exit status is 1 when a benchmark got slower than the threshold.
+
+    python -m amaze.bench --output baseline.json
+    python -m amaze.bench --baseline baseline.json --threshold 0.1
+'''
+import argparse
+import json
+import platform
+import sys
+import time
+import cv2
+import numpy as np
+from amaze.engine import Engine, create_sprite
+from amaze.evaluate import Evaluator
+from amaze.maze import factory as maze_factory
+from amaze.maze.cache import MazeCache
+
+MAZE_ARGS = {
+    'SquareMaze': {'seed': 616636},
+    'HexagonalMaze': {'seed': 616636, 'num_cells': 10},
+    'CircularMaze': {'seed': 616636, 'num_levels': 7},
+}
+SIZES = [512, 1024]
+ENGINE_STEPS = 1000
+SPRITE_DRAWS = 1000
+REPLAY_ACTIONS = 1000
+
+
+def bench_generate(maze, size):
+    '''
+    One maze generated per call
+    '''
+    level = {'maze': maze, 'maze_args': dict(MAZE_ARGS[maze], size=[size, size])}
+
+    def run():
+        maze_factory(**level).generate()
+    return run, 1
+
+
+def bench_engine(level, render):
+    '''
+    ENGINE_STEPS calls of Engine.forward per call, standing still at the start of the level. Standing still
+    does not change the state of the engine, so it is created and the maze generated once, outside the timing.
+    '''
+    engine = Engine(maze_factory(**level), visualize=False, render=render)
+    engine.forward(None)
+    action = np.array([0, 0])
+
+    def run():
+        for _ in range(ENGINE_STEPS):
+            _, _, status = engine.forward(action)
+        assert status == 'RUNNING', 'The start position of the benchmark level must be free'
+    return run, ENGINE_STEPS
+
+
+def bench_sprite():
+    '''
+    SPRITE_DRAWS draws of the louse sprite per call
+    '''
+    sprite = create_sprite('louse')
+    img = np.zeros((1024, 1024, 3), dtype=np.uint8)
+    pos = np.array([512, 512])
+
+    def run():
+        for _ in range(SPRITE_DRAWS):
+            sprite.draw(img, pos)
+    return run, SPRITE_DRAWS
+
+
+def bench_replay(levels, actions_list, maze_cache, workers):
+    '''
+    Evaluator.replay_levels of all levels per call, throughput in levels
+    '''
+    evaluator = Evaluator(visualize=False, maze_cache=maze_cache, workers=workers)
+
+    def run():
+        evaluator.replay_levels(levels, actions_list)
+    return run, len(actions_list)
+
+
+def measure(run, units, warmup, repeat):
+    '''
+    :return: dict with the min, median and mean seconds per call and the median throughput in units per second
+    '''
+    for _ in range(warmup):
+        run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    median = float(np.median(timings))
+    return {'min': min(timings), 'median': median, 'mean': float(np.mean(timings)), 'repeat': repeat,
+            'per_second': units / median}
+
+
+def benchmarks(args):
+    '''
+    :return: list of (name, setup), setup returns (run, units) so expensive setup is skipped for filtered benchmarks
+    '''
+    evaluator = Evaluator(visualize=False)
+    levels = evaluator.load_levels(args.levels)
+    if args.actions:
+        actions_list = evaluator.load_actions_list(args.actions)
+    else:
+        actions_list = [{'level': i, 'actions': [[0, 0]] * REPLAY_ACTIONS} for i in range(len(levels))]
+    maze_cache = MazeCache(args.maze_cache) if args.maze_cache else None
+
+    result = []
+    for maze in MAZE_ARGS:
+        for size in SIZES:
+            result.append((f'generate/{maze}/{size}', lambda maze=maze, size=size: bench_generate(maze, size)))
+    result.append(('engine/headless', lambda: bench_engine(levels[0], render=False)))
+    result.append(('engine/render', lambda: bench_engine(levels[0], render=True)))
+    result.append(('sprite/draw', bench_sprite))
+    result.append(('replay_levels', lambda: bench_replay(levels, actions_list, maze_cache, args.workers)))
+    return result
+
+
+def compare(results, baseline, threshold):
+    '''
+    :return: list of (name, ratio, regressed), ratio is the median time relative to the baseline
+    '''
+    comparison = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        comparison.append((name, ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='resource/levels.txt')
+    parser.add_argument('--actions', default=None, help='Actions to replay, defaults to standing still on every level')
+    parser.add_argument('--maze-cache', default=None, help='Directory for caching generated mazes of the replay')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes of the replay')
+    parser.add_argument('--filter', default=None, help='Only run the benchmarks whose name contains this')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='File to store the results in as JSON')
+    parser.add_argument('--baseline', default=None, help='Results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown of the median time that counts as a regression')
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in benchmarks(args):
+        if args.filter and args.filter not in name:
+            continue
+        run, units = setup()
+        results[name] = measure(run, units, args.warmup, args.repeat)
+        print(f'{name:32s} {1000 * results[name]["median"]:10.2f} ms {results[name]["per_second"]:12.1f} /s',
+              file=sys.stderr)
+
+    output = {
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                        'machine': platform.machine()},
+        'benchmarks': results,
+    }
+    print(json.dumps(output, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+        regressions = 0
+        for name, ratio, regressed in compare(results, baseline, args.threshold):
+            regressions += regressed
+            print(f'{name:32s} {ratio:6.2f}x {"REGRESSION" if regressed else ""}', file=sys.stderr)
+        if regressions:
+            print(f'{regressions} benchmarks regressed by more than {100 * args.threshold:.0f}%', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
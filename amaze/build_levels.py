@@ -0,0 +1,157 @@
+'''
+Builds a curated level set.
+
+Candidate seeds of every maze type are generated and scored on a process pool. A candidate is rejected when the
+goal can not be reached from the start at Engine.PLAYER_RADIUS, found by a flood fill of the mask, or when start
+and goal are so close that the level is trivial. The accepted candidates are scored by the geodesic length of the
+shortest path and the number of branches, and the same number of levels is picked for every maze type, spread
+evenly over the difficulty.
+
+    python -m amaze.build_levels --candidates 2000 --per-type 30 --output resource/levels.txt
+'''
+import argparse
+import collections
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from amaze.collision import MAX_ACTION
+from amaze.engine import Engine
+from amaze.maze import factory as maze_factory
+
+# Arguments of every maze type besides the seed. The circular mazes need sectors of at least 32 pixels, with
+# shorter ones some rings can not be passed at the player radius.
+MAZE_ARGS = {
+    'SquareMaze': {'size': [1024, 1024]},
+    'HexagonalMaze': {'size': [1024, 1024], 'num_cells': 10},
+    'CircularMaze': {'size': [1024, 1024], 'num_levels': 7, 'min_sector_arc': 32},
+}
+MAX_SEED = 32000000
+# Size in pixels of the neighbourhood of a branch end, see count_branches
+BRANCH_WINDOW = 16
+
+
+def count_branches(distance, window):
+    '''
+    :param distance: geodesic distance field, inf where the goal can not be reached
+    :param window: size of the neighbourhood a branch end is the farthest point of, smaller ripples of the
+                   distance along curved walls are not counted
+    :return: number of branch ends, the plateaus of reachable pixels that are local maxima of the distance. These
+             are the ends of dead ends and the points where the two ways around a loop meet.
+    '''
+    reachable = np.isfinite(distance)
+    field = np.where(reachable, distance, -1).astype(np.float32)
+    maxima = reachable & (field >= cv2.dilate(field, np.ones((window, window), dtype=np.uint8)))
+    num_labels, _ = cv2.connectedComponents(maxima.astype(np.uint8), connectivity=8)
+    return num_labels - 1
+
+
+def score_level(level, downsample=2, min_distance=200):
+    '''
+    Generates a level and measures it
+
+    :param downsample: downsampling of the flood fill, see amaze.maze.distance.geodesic_distance. Narrow
+                       passages are blocked on coarser grids, so levels are only ever rejected wrongly, never
+                       accepted wrongly.
+    :param min_distance: shortest geodesic distance in pixels between start and goal of an accepted level
+    :return: (metrics, None) for an accepted level, (None, reason) for a rejected one
+    '''
+    m = maze_factory(**level)
+    _, _, startpos, goalpos = m.generate()
+    distance = m.distance_field(Engine.PLAYER_RADIUS, downsample)
+    path_length = float(distance[startpos[1] // downsample, startpos[0] // downsample])
+    if not np.isfinite(path_length):
+        return None, 'unsolvable'
+    if path_length < min_distance:
+        return None, 'too close'
+    return {
+        'optimal_actions': int(np.ceil(path_length / MAX_ACTION)),
+        'tortuosity': round(path_length / max(1.0, float(np.linalg.norm(np.subtract(goalpos, startpos)))), 3),
+        'branches': count_branches(distance, BRANCH_WINDOW // downsample | 1),
+    }, None
+
+
+def _score_task(level, downsample, min_distance):
+    return score_level(level, downsample, min_distance)
+
+
+def candidate_levels(maze, num_candidates, rng):
+    return [{'maze': maze, 'maze_args': dict(MAZE_ARGS[maze], seed=seed)}
+            for seed in rng.sample(range(MAX_SEED), num_candidates)]
+
+
+def rank(values):
+    '''
+    :return: the rank of every value scaled to [0, 1], ties get the same rank
+    '''
+    values = np.asarray(values)
+    if len(values) < 2:
+        return np.zeros(len(values))
+    return np.searchsorted(np.sort(values), values) / (len(values) - 1)
+
+
+def select_levels(levels, metrics, count):
+    '''
+    Rates the difficulty of accepted levels of one maze type and picks count of them spread over the difficulty
+
+    :return: the picked levels, sorted from easy to hard, with their metrics and difficulty in 'difficulty'
+    '''
+    difficulty = (rank([m['optimal_actions'] for m in metrics]) + rank([m['branches'] for m in metrics])) / 2
+    order = np.argsort(difficulty, kind='stable')
+    picked = order[np.round(np.linspace(0, len(order) - 1, count)).astype(int)] if count else []
+    return [dict(levels[i], difficulty=dict(metrics[i], score=round(float(difficulty[i]), 3))) for i in picked]
+
+
+def build_levels(mazes, num_candidates, per_type, workers=1, seed=None, downsample=2, min_distance=200):
+    '''
+    :return: (levels, rejections), rejections counts the rejected candidates of every maze type by reason
+    '''
+    rng = random.Random(seed)
+    candidates = [level for maze in mazes for level in candidate_levels(maze, num_candidates, rng)]
+    with ProcessPoolExecutor(workers) as pool:
+        scores = list(pool.map(_score_task, candidates, [downsample] * len(candidates),
+                               [min_distance] * len(candidates), chunksize=16))
+
+    levels = []
+    rejections = {}
+    for maze in mazes:
+        accepted = [(level, metrics) for level, (metrics, _) in zip(candidates, scores)
+                    if level['maze'] == maze and metrics is not None]
+        rejections[maze] = collections.Counter(reason for level, (_, reason) in zip(candidates, scores)
+                                               if level['maze'] == maze and reason is not None)
+        assert len(accepted) >= per_type, \
+            f'Only {len(accepted)} of {num_candidates} {maze} candidates were accepted, {per_type} are needed'
+        levels.extend(select_levels([level for level, _ in accepted], [metrics for _, metrics in accepted],
+                                    per_type))
+    return levels, rejections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mazes', nargs='+', default=list(MAZE_ARGS), choices=list(MAZE_ARGS))
+    parser.add_argument('--candidates', type=int, default=1000, help='Number of candidate seeds per maze type')
+    parser.add_argument('--per-type', type=int, default=30, help='Number of levels per maze type')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes, defaults to the CPU count')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the candidate seeds')
+    parser.add_argument('--downsample', type=int, default=2, help='Downsampling of the flood fill')
+    parser.add_argument('--min-distance', type=int, default=200,
+                        help='Shortest path in pixels between start and goal of an accepted level')
+    parser.add_argument('--output', default='resource/levels.txt')
+    args = parser.parse_args()
+    if args.per_type > args.candidates:
+        parser.error('--per-type can not be larger than --candidates')
+
+    levels, rejections = build_levels(args.mazes, args.candidates, args.per_type, args.workers, args.seed,
+                                      args.downsample, args.min_distance)
+    for maze, reasons in rejections.items():
+        print(f'{maze:16s} rejected {sum(reasons.values())} of {args.candidates} {dict(reasons)}', file=sys.stderr)
+    with open(args.output, 'w') as f:
+        for level in levels:
+            f.write(json.dumps(level))
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+'''
+Vectorized versions of the collision test in Engine.check_collision.
+
+Engine.check_collision uses crop_collision, which crops the mask to the bounding box of a move grown by the
+player radius and samples the crop under a thick line drawn from the crop corner. The pixels of that line only
+depend on the crop size, that is on the absolute action, so they are precomputed once as a stencil per action.
+'''
+import functools
+import cv2
+import numpy as np
+
+MAX_ACTION = 5
+
+
+@functools.lru_cache(maxsize=None)
+def stencil_table(radius, max_action=MAX_ACTION):
+    '''
+    Pixel offsets sampled by Engine.check_collision for every absolute action
+
+    :return: (ys, xs) arrays of shape (max_action+1, max_action+1, K) indexed by [|dy|, |dx|].
+             Offsets are relative to the top left corner of the crop, short stencils are padded by repeating
+             their first offset.
+    '''
+    stencils = {}
+    for ady in range(max_action+1):
+        for adx in range(max_action+1):
+            crop = np.zeros((ady + 1 + 2*radius, adx + 1 + 2*radius), dtype=np.uint8)
+            cv2.line(crop, (0, 0), crop.shape, 255, radius * 2)
+            stencils[ady, adx] = np.nonzero(crop)
+    length = max(len(ys) for ys, _ in stencils.values())
+    ys = np.zeros((max_action+1, max_action+1, length), dtype=np.int64)
+    xs = np.zeros_like(ys)
+    for (ady, adx), (sy, sx) in stencils.items():
+        ys[ady, adx] = sy[0]
+        xs[ady, adx] = sx[0]
+        ys[ady, adx, :len(sy)] = sy
+        xs[ady, adx, :len(sx)] = sx
+    ys.setflags(write=False)
+    xs.setflags(write=False)
+    return ys, xs
+
+
+def crop_collision(mask, pos, next_pos, radius):
+    '''
+    The reference collision test of a single move, used by Engine.check_collision
+    '''
+    if np.any(next_pos < radius) or np.any(next_pos+radius >= mask.shape):
+        return True
+    roi = (min(pos[0], next_pos[0])-radius, min(pos[1], next_pos[1])-radius), \
+          (max(pos[0], next_pos[0])+1+radius, max(pos[1], next_pos[1])+1+radius)
+    mask = mask[roi[0][1]:roi[1][1], roi[0][0]:roi[1][0]]
+    line = np.zeros_like(mask)
+    cv2.line(line, (0, 0), mask.shape, 255, radius * 2)
+    sampled_points = mask[line > 0]
+    return np.any(sampled_points > 0)
+
+
+def out_of_bounds(next_pos, shape, radius):
+    '''
+    Vectorized bounds test of Engine.check_collision for positions of shape (N, 2)
+
+    :param shape: shape of the mask, or one shape per position of shape (N, 2)
+    '''
+    return np.any(next_pos < radius, axis=-1) | np.any(next_pos + radius >= np.asarray(shape), axis=-1)
+
+
+def in_range(actions, max_action=MAX_ACTION):
+    '''
+    :return: boolean array over the last axis, True for the actions within +- max_action in both dimensions.
+             Compared without np.abs, which overflows for the minimum of a narrow int type, and without a cast,
+             which would truncate floats.
+    '''
+    return np.all((actions >= -max_action) & (actions <= max_action), axis=-1)
+
+
+def swept_collisions(mask, pos, next_pos, radius, index=None, shape=None):
+    '''
+    Vectorized Engine.check_collision for N moves from pos to next_pos, both of shape (N, 2)
+
+    :param index: for a stack of masks of shape (M, H, W), the mask of every move
+    :param shape: the (height, width) of the masks, per move of shape (N, 2) when the stacked masks are padded
+    :return: (collided, exact) boolean arrays of shape (N,). exact is False for the moves where the crop
+             of Engine.check_collision would have been clipped by the mask border, the stencil does not
+             reproduce those.
+    '''
+    pos = np.asarray(pos, dtype=np.int64)
+    next_pos = np.asarray(next_pos, dtype=np.int64)
+    shape = np.broadcast_to(mask.shape[-2:] if shape is None else shape, pos.shape)
+    collided = out_of_bounds(next_pos, shape, radius)
+
+    origin = np.minimum(pos, next_pos) - radius
+    end = np.maximum(pos, next_pos) + 1 + radius
+    exact = collided | (np.all(origin >= 0, axis=-1) & (end[:, 0] <= shape[:, 1]) & (end[:, 1] <= shape[:, 0]))
+    inside = ~collided & exact
+    if not np.any(inside):
+        return collided, exact
+
+    absolute = np.abs(next_pos[inside] - pos[inside])
+    ys, xs = stencil_table(radius)
+    ys = ys[absolute[:, 1], absolute[:, 0]] + origin[inside, 1:2]
+    xs = xs[absolute[:, 1], absolute[:, 0]] + origin[inside, 0:1]
+    if index is None:
+        collided[inside] = np.any(mask[ys, xs] > 0, axis=-1)
+    else:
+        collided[inside] = np.any(mask[np.asarray(index)[inside, None], ys, xs] > 0, axis=-1)
+    return collided, exact
+
+
+def exact_collisions(mask, pos, next_pos, radius, index=None, shape=None):
+    '''
+    swept_collisions with the result of Engine.check_collision for every move. The moves next to the border,
+    where the crop of crop_collision is clipped, are tested with crop_collision. For padded stacked masks it gets
+    the mask of the move without the padding, which would count as a wall.
+
+    :return: collided, boolean array of shape (N,)
+    '''
+    collided, exact = swept_collisions(mask, pos, next_pos, radius, index=index, shape=shape)
+    if shape is not None:
+        shape = np.broadcast_to(shape, np.shape(pos))
+    for i in np.flatnonzero(~exact):
+        move_mask = mask if index is None else mask[index[i]]
+        if shape is not None:
+            move_mask = move_mask[:shape[i][0], :shape[i][1]]
+        collided[i] = crop_collision(move_mask, pos[i], next_pos[i], radius)
+    return collided
+
+
+def collision_map(mask, action, radius):
+    '''
+    Engine.check_collision of one action from every position at once
+
+    :return: boolean array of mask.shape, [y, x] is True when moving by action from (x, y) collides
+    '''
+    ax, ay = action
+    ys, xs = stencil_table(radius)
+    kernel = np.zeros((abs(ay) + 1 + 2*radius, abs(ax) + 1 + 2*radius), dtype=np.uint8)
+    kernel[ys[abs(ay), abs(ax)], xs[abs(ay), abs(ax)]] = 1
+    # The crop starts radius pixels before the player, and action pixels more for moves up or to the left
+    anchor = (radius - min(0, ax), radius - min(0, ay))
+    collided = cv2.dilate((np.asarray(mask) > 0).astype(np.uint8), kernel, anchor=anchor,
+                          borderType=cv2.BORDER_CONSTANT, borderValue=0) > 0
+    # Same axis order as the bounds test of Engine.check_collision
+    next_x = np.arange(mask.shape[1]) + ax
+    next_y = np.arange(mask.shape[0]) + ay
+    collided |= ((next_x < radius) | (next_x + radius >= mask.shape[0]))[None, :]
+    collided |= ((next_y < radius) | (next_y + radius >= mask.shape[1]))[:, None]
+    return collided
+
+
+class PackedMask(object):
+    '''
+    Read-only mask with one bit per pixel, stored with np.packbits.
+
+    It is indexed like the uint8 mask by the collision tests, with slices for the crop of crop_collision and with
+    arrays of y and x for the stencils of swept_collisions, and by rows with mask[y] or mask[y1:y2]. Only the
+    indexed pixels are unpacked, they are 1 where the mask is not 0. It has no other ndarray methods or
+    operators, np.asarray unpacks the whole mask for code that needs them.
+    '''
+    dtype = np.dtype(np.uint8)
+    ndim = 2
+
+    def __init__(self, bits, width):
+        '''
+        :param bits: packed rows of shape (height, ceil(width / 8)), see pack
+        '''
+        self.bits = bits
+        self.shape = (bits.shape[0], width)
+
+    @classmethod
+    def pack(cls, mask):
+        return cls(np.packbits(np.asarray(mask) > 0, axis=1), mask.shape[1])
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index, slice(None))
+        assert len(index) == 2, 'A mask is indexed by at most a row and a column index'
+        ys, xs = index
+        if isinstance(xs, slice):
+            start, stop, step = xs.indices(self.shape[1])
+            assert step == 1, 'Only contiguous slices of columns are supported'
+            rows = np.unpackbits(self.bits[ys, start >> 3:(stop + 7) >> 3], axis=-1)
+            return rows[..., start & 7:(start & 7) + max(0, stop - start)]
+        xs = np.asarray(xs)
+        return (self.bits[ys, xs >> 3] >> (7 - (xs & 7))) & 1
+
+    def __array__(self, dtype=None, copy=None):
+        mask = np.unpackbits(self.bits, axis=1, count=self.shape[1])
+        return mask if dtype is None else mask.astype(dtype)
+
+
+class InflatedMask(object):
+    '''
+    Mask with the walls grown by the player radius.
+
+    The player collides when its centre touches an inflated wall, so a move is tested by sampling the inflated
+    mask at every pixel of the centre line from pos to next_pos. This is the swept path of the player disk,
+    which differs from Engine.check_collision in these cases:
+
+    - Moves where dx and dy have opposite signs. check_collision always samples the diagonal from the top left
+      to the bottom right of the crop, so it tests the mirrored path.
+    - Moves with |dx| != |dy|, including axis aligned and zero moves. check_collision samples a band along the
+      diagonal of the crop, which only follows the move when |dx| == |dy|. Otherwise it reaches further than the
+      player radius in two corners of the crop and less in the other two.
+    - Walls between the player radius and the corners of the crop. The player is a disk here and a clipped
+      square in check_collision.
+
+    Out of bounds moves are handled the same way as in check_collision. On the shipped levels about 96% of random
+    moves get the same result, and check_collision is the stricter of the two in most of the others.
+    '''
+    def __init__(self, mask, radius, packed=False):
+        disk = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2*radius + 1, 2*radius + 1))
+        inflated = cv2.dilate((np.asarray(mask) > 0).astype(np.uint8), disk)
+        self.shape = mask.shape
+        self.radius = radius
+        self.packed = packed
+        self.mask = np.packbits(inflated, axis=1) if packed else inflated
+
+    def blocked(self, x, y):
+        if self.packed:
+            return (self.mask[y, x >> 3] >> (7 - (x & 7))) & 1
+        return self.mask[y, x]
+
+    def collides(self, pos, next_pos):
+        x, y = int(pos[0]), int(pos[1])
+        nx, ny = int(next_pos[0]), int(next_pos[1])
+        if min(nx, ny) < self.radius or nx + self.radius >= self.shape[0] or ny + self.radius >= self.shape[1]:
+            return True
+        dx, dy = nx - x, ny - y
+        n = max(abs(dx), abs(dy))
+        if n == 0:
+            return bool(self.blocked(x, y))
+        for i in range(n + 1):
+            # Round to nearest pixel on the centre line
+            if self.blocked(x + (2*dx*i + n) // (2*n), y + (2*dy*i + n) // (2*n)):
+                return True
+        return False
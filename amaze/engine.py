@@ -1,51 +1,222 @@
+import functools
 import numpy as np
 import cv2
+from amaze.collision import InflatedMask, crop_collision, in_range
+
+
+@functools.lru_cache(maxsize=None)
+def load_frame(filename, downsample=1, gray=False):
+    '''
+    Registry of sprite frames. Images are decoded once per process, on first use, and shared between all
+    sprites using them.
+
+    :param downsample: shrink the frame by this factor, a pixel is opaque when at least half of it was
+    :param gray: convert the frame to a single gray channel
+    '''
+    im = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
+    if gray:
+        im = np.dstack([cv2.cvtColor(im[..., :3], cv2.COLOR_BGR2GRAY), im[..., 3]])
+    if downsample > 1:
+        height, width = im.shape[:2]
+        im = cv2.resize(im, (max(1, width // downsample), max(1, height // downsample)),
+                        interpolation=cv2.INTER_AREA)
+        im[..., -1] = np.where(im[..., -1] >= 128, 255, 0)
+    return SpriteFrame(im)
+
+
+class SpriteFrame(object):
+    '''
+    The opaque pixels of a sprite image, stored as pixel indices and their colors
+    '''
+    def __init__(self, im):
+        '''
+        :param im: image with the color channels followed by an alpha channel
+        '''
+        self.height, self.width = im.shape[:2]
+        self.ys, self.xs = np.nonzero(im[..., -1])
+        colors = im[self.ys, self.xs, :-1]
+        self.colors = np.ascontiguousarray(colors[:, 0] if colors.shape[1] == 1 else colors)
+        self.flat_indices = {}
+
+    def flat(self, stride):
+        '''
+        :return: indices of the opaque pixels in a flattened image with rows of stride pixels
+        '''
+        if stride not in self.flat_indices:
+            self.flat_indices[stride] = self.ys * stride + self.xs
+        return self.flat_indices[stride]
+
+    def draw(self, img, x, y):
+        '''
+        Copies the opaque pixels into img with the top left corner of the sprite at (x, y)
+        '''
+        height, width = img.shape[:2]
+        if 0 <= x and 0 <= y and x + self.width <= width and y + self.height <= height:
+            if img.flags.c_contiguous:
+                img.reshape(height * width, *img.shape[2:])[self.flat(width) + (y * width + x)] = self.colors
+            else:
+                img[self.ys + y, self.xs + x] = self.colors
+            return
+        ys, xs = self.ys + y, self.xs + x
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+        img[ys[inside], xs[inside]] = self.colors[inside]
 
 
 class Sprite(object):
     def __init__(self, filenames, offset):
+        '''
+        Frames are loaded on the first draw, so sprites that are never drawn never read their files
+        '''
         self.current_frame = 0
-        self.width = None
-        self.height = None
-        self.frames = self.load_frames(filenames)
+        self.filenames = filenames
+        self._frames = None
         self.offset_x, self.offset_y = offset
 
-    def load_frames(self, filenames):
-        frames = []
-        for filename in filenames:
-            im = cv2.imread(filename, cv2.IMREAD_UNCHANGED)
-            rgb = im[..., :3]
-            alpha = im[..., 3].astype(np.bool)
-            frames.append( (rgb, alpha) )
-            self.height, self.width, _ = im.shape
-        return frames
+    @property
+    def frames(self):
+        if self._frames is None:
+            self._frames = [load_frame(filename) for filename in self.filenames]
+        return self._frames
 
-    def draw(self, img, pos):
-        rgb, alpha = self.frames[self.current_frame]
+    @property
+    def width(self):
+        return self.frames[-1].width
 
-        x, y = tuple(pos)
-        x, y = x - self.offset_x, y - self.offset_y
+    @property
+    def height(self):
+        return self.frames[-1].height
 
-        y1, y2 = max(0, y), min(img.shape[0], y + rgb.shape[0])
-        x1, x2 = max(0, x), min(img.shape[1], x + rgb.shape[1])
+    def frame(self, downsample=1, gray=False):
+        '''
+        :return: the SpriteFrame the next draw uses
+        '''
+        if downsample == 1 and not gray:
+            return self.frames[self.current_frame]
+        return load_frame(self.filenames[self.current_frame], downsample, gray)
 
-        y1o, y2o = max(0, -y), min(rgb.shape[0], img.shape[0] - y)
-        x1o, x2o = max(0, -x), min(rgb.shape[1], img.shape[1] - x)
+    def corner(self, pos, downsample=1):
+        '''
+        :return: (x, y) of the top left corner of the sprite at pos, in an image downsampled by downsample
+        '''
+        return int(pos[0]) // downsample - self.offset_x // downsample, \
+            int(pos[1]) // downsample - self.offset_y // downsample
 
-        img_crop = img[y1:y2, x1:x2]
-        rgb_crop = rgb[y1o:y2o, x1o:x2o]
-        alpha_crop = alpha[y1o:y2o, x1o:x2o]
-        img_crop[alpha_crop] = rgb_crop[alpha_crop]
+    def bounds(self, shape, pos, downsample=1, gray=False):
+        '''
+        :return: (y1, y2, x1, x2) of the pixels the next draw at pos may change in an image of the given shape
+        '''
+        frame = self.frame(downsample, gray)
+        x, y = self.corner(pos, downsample)
+        return max(0, y), min(shape[0], y + frame.height), max(0, x), min(shape[1], x + frame.width)
 
-        self.current_frame = (self.current_frame + 1) % len(self.frames)
+    def advance(self):
+        self.current_frame = (self.current_frame + 1) % len(self.filenames)
 
+    def draw(self, img, pos):
+        x, y = self.corner(pos)
+        self.frame().draw(img, x, y)
+        self.advance()
         return img
 
 
+# Frame files and offset of every sprite the engines draw
+SPRITES = {
+    'louse': ([f'resource/image/louse_{i}.png' for i in range(8)], (85, 15)),
+    'win': ([f'resource/image/burning_{i}.png' for i in range(8)], (84, 67)),
+    'player': (['resource/image/laser-dot.bmp'], (6, 6)),
+    'loss': (['resource/image/laser-dot-wrong.png'], (6, 6)),
+}
+
+
+def create_sprite(name):
+    '''
+    :return: a new Sprite of SPRITES, with its own animation frame
+    '''
+    filenames, offset = SPRITES[name]
+    return Sprite(filenames, offset)
+
+
+class Canvas(object):
+    '''
+    Frame buffer that is redrawn incrementally.
+
+    Only the rectangles marked as dirty since the last frame are restored from the background. The whole buffer
+    is copied when the background is a different array than last frame, or after invalidate() for backgrounds
+    that were changed in place.
+    '''
+    def __init__(self, buffer=None):
+        '''
+        :param buffer: optional array to draw into, allocated on the first frame if not given
+        '''
+        self.buffer = buffer
+        self.background = None
+        self.dirty = []
+
+    def invalidate(self):
+        self.background = None
+
+    def clear(self, background):
+        '''
+        :return: the buffer with the background restored under everything drawn since the last clear
+        '''
+        if self.buffer is None or self.buffer.shape != background.shape:
+            self.buffer = background.copy()
+        elif background is not self.background:
+            self.buffer[:] = background
+        else:
+            for y1, y2, x1, x2 in self.dirty:
+                self.buffer[y1:y2, x1:x2] = background[y1:y2, x1:x2]
+        self.background = background
+        self.dirty = []
+        return self.buffer
+
+    def mark(self, bounds):
+        self.dirty.append(bounds)
+
+
+def scene_changed(scene, version):
+    '''
+    :param version: version of the scene at the last update
+    :return: False when the scene says its img and mask are the same as at the last update. Scenes that are not
+             static and have no version may change them in place, so they always count as changed.
+    '''
+    if getattr(scene, 'static', False):
+        return False
+    return getattr(scene, 'version', None) is None or scene.version != version
+
+
 class Engine():
+    '''
+    Runs the game loop of a scene.
+
+    A scene has generate() -> (img, mask, startpos, goalpos) and update() -> (img, mask). Scenes can tell the
+    engine how often update() has to be called:
+
+    - static = True: img and mask never change, update() is never called.
+    - version: a counter that changes whenever img or mask change, update() is only called when it did.
+
+    For other scenes update() is called every step and img and mask count as changed every time. When the scene
+    changes, the engine validates the new arrays and rebuilds the collision and render state derived from them.
+
+    The mask may be an amaze.collision.PackedMask and img a read-only view, see amaze.maze.compact. The collision
+    tests read the packed mask directly and img is only copied into the render buffer.
+    '''
     PLAYER_RADIUS = 6
+    # Bump whenever a change to the rules changes the outcome of replayed actions, this invalidates stored results
+    VERSION = 1
 
-    def __init__(self, scene, visualize=True, consume_input=False, render=True, max_speed=10):
+    def __init__(self, scene, visualize=True, consume_input=False, render=True, max_speed=10, collision='exact',
+                 packed_collision=False, recorder=None, timer=None, observation=None):
+        '''
+        :param collision: 'exact' for the reference collision test, 'inflated' to test moves against a mask
+                          with the walls grown by the player radius (see amaze.collision.InflatedMask)
+        :param packed_collision: bit-pack the inflated mask
+        :param recorder: optional amaze.recorder.VideoRecorder that every shown frame is written to
+        :param timer: optional amaze.profiler.PhaseTimer that times forward and its phases
+        :param observation: optional amaze.observation.Observation that renders the frames instead of the full
+                            color scene, these are also the frames shown and recorded
+        '''
+        assert collision in ('exact', 'inflated'), f'Unknown collision mode {collision}'
         self.scene = scene
         self.max_speed = max_speed
         self.visualize = visualize
@@ -56,11 +227,21 @@ class Engine():
         self.pos = None
         self.goal = None
         self.render_scene = render
-        self.louse_sprite = Sprite([f'resource/image/louse_{i}.png' for i in range(8)], offset=(85, 15))
-        self.win_sprite = Sprite([f'resource/image/burning_{i}.png' for i in range(8)], offset=(84, 67))
-        self.player_sprite = Sprite(['resource/image/laser-dot.bmp'], offset=(6, 6))
-        self.loss_sprite = Sprite(['resource/image/laser-dot-wrong.png'], offset=(6, 6))
-        self.img_cache = None
+        self.collision = collision
+        self.packed_collision = packed_collision
+        self.inflated_mask = None
+        self.scene_version = None
+        self.recorder = recorder
+        self.louse_sprite = create_sprite('louse')
+        self.win_sprite = create_sprite('win')
+        self.player_sprite = create_sprite('player')
+        self.loss_sprite = create_sprite('loss')
+        self.canvas = Canvas()
+        self.observation = observation
+        self.timer = timer
+        if timer is not None:
+            for phase in ('forward', 'update_scene', 'validate_action', 'check_collision', 'render', 'show_scene'):
+                setattr(self, phase, timer.wrap(phase, getattr(self, phase)))
 
     def forward(self, action):
         '''
@@ -72,13 +253,13 @@ class Engine():
         if action is None:
             assert not self.initialized, "Can't initialize game twice"
             self.initialized = True
-            self.img, self.mask, self.pos, self.goal = self.scene.generate()
+            img, mask, self.pos, self.goal = self.scene.generate()
+            self.set_scene(img, mask)
             if self.visualize:
                 cv2.namedWindow('GAME', cv2.WINDOW_NORMAL)
         else:
-            self.img, self.mask = self.scene.update()
-            assert self.img.dtype == np.uint8, 'Maze img must have dtype np.uint8'
-            assert self.mask.dtype == np.uint8, 'Maze mas must have dtype np.uint8'
+            if self.scene_changed():
+                self.update_scene()
             action = self.validate_action(action, self.pos, self.mask)
             if self.check_collision(action, self.pos, self.mask):
                 self.pos = self.update_position(self.pos, action)
@@ -87,26 +268,43 @@ class Engine():
             if self.check_finished(self.pos, self.goal):
                 return None, None, 'YOU WON'
         view = None
-        if self.render_scene or self.visualize:
+        if self.render_scene or self.visualize or self.recorder is not None:
             view = self.render(self.img, self.pos, self.goal)
-        if self.visualize:
+        if self.visualize or self.recorder is not None:
             self.show_scene(view)
         return view, self.pos.copy(), 'RUNNING'
 
+    def scene_changed(self):
+        '''
+        :return: False when the scene says its img and mask are the same as at the last update
+        '''
+        return scene_changed(self.scene, self.scene_version)
+
+    def update_scene(self):
+        self.set_scene(*self.scene.update())
+
+    def set_scene(self, img, mask):
+        '''
+        Takes over img and mask from generate() or from an update() of a changed scene
+        '''
+        assert img.dtype == np.uint8, 'Maze img must have dtype np.uint8'
+        assert mask.dtype == np.uint8, 'Maze mas must have dtype np.uint8'
+        if self.collision == 'inflated':
+            self.inflated_mask = InflatedMask(mask, self.PLAYER_RADIUS, self.packed_collision)
+        self.canvas.invalidate()
+        if self.observation is not None:
+            self.observation.invalidate()
+        self.img, self.mask = img, mask
+        self.scene_version = getattr(self.scene, 'version', None)
+
     def update_position(self, pos, action):
         return pos + action
 
     def check_collision(self, action, pos, mask):
         next_pos = pos + action
-        if np.any(next_pos < self.PLAYER_RADIUS) or np.any(next_pos+self.PLAYER_RADIUS >= mask.shape):
-            return True
-        roi = (min(pos[0], next_pos[0])-self.PLAYER_RADIUS, min(pos[1], next_pos[1])-self.PLAYER_RADIUS), \
-              (max(pos[0], next_pos[0])+1+self.PLAYER_RADIUS, max(pos[1], next_pos[1])+1+self.PLAYER_RADIUS)
-        mask = mask[roi[0][1]:roi[1][1], roi[0][0]:roi[1][0]]
-        line = np.zeros_like(mask)
-        cv2.line(line, (0, 0), mask.shape, 255, self.PLAYER_RADIUS * 2)
-        sampled_points = mask[line > 0]
-        return np.any(sampled_points > 0)
+        if self.inflated_mask is not None:
+            return self.inflated_mask.collides(pos, next_pos)
+        return crop_collision(mask, pos, next_pos, self.PLAYER_RADIUS)
 
     def check_finished(self, pos, goal):
         return np.linalg.norm(pos-goal) < 10
@@ -114,33 +312,45 @@ class Engine():
     def validate_action(self, action, pos, mask):
         assert isinstance(action, np.ndarray), 'Action must be a numpy array'
         assert action.size == 2, 'Action must have exactly to elements'
-        assert np.all(np.abs(action) <= 5), 'Action must be withing +- 5 in both dimensions'
+        assert np.issubdtype(action.dtype, np.integer), 'Action must be integers'
+        assert in_range(action.reshape(-1)), 'Action must be withing +- 5 in both dimensions'
         return action
         # return False
 
     def show_scene(self, img):
-        cv2.imshow('GAME', img)
-        if self.consume_input:
-            cv2.waitKey(1)
+        if self.recorder is not None:
+            self.recorder.write(img)
+        if self.visualize:
+            cv2.imshow('GAME', img)
+            if self.consume_input:
+                cv2.waitKey(1)
 
-    def animate_win(self):
+    def animate(self, draw, sprites, positions):
+        '''
+        Shows 150 frames drawn by draw(img). Frames are only paced at 20 ms when visualizing, recorded frames are
+        written as fast as they are drawn.
+
+        :param sprites: sprites drawn by draw at positions, to restore the background under them between frames
+        '''
         for _ in range(150):
             img, mask = self.scene.update()
-            img = img.copy()
-            img = self.draw_win(img, self.goal)
+            img = self.canvas.clear(img)
+            for sprite, pos in zip(sprites, positions):
+                self.canvas.mark(sprite.bounds(img.shape, pos))
+            img = draw(img)
             self.show_scene(img)
-            cv2.waitKey(20)
+            if self.visualize:
+                cv2.waitKey(20)
+
+    def animate_win(self):
+        self.animate(lambda img: self.draw_win(img, self.goal), [self.win_sprite], [self.goal])
 
     def draw_win(self, img, pos):
         return self.win_sprite.draw(img, pos)
 
     def animate_loss(self):
-        for _ in range(150):
-            img, mask = self.scene.update()
-            img = img.copy()
-            img = self.draw_loss(img, self.pos, self.goal)
-            self.show_scene(img)
-            cv2.waitKey(20)
+        self.animate(lambda img: self.draw_loss(img, self.pos, self.goal), [self.louse_sprite, self.loss_sprite],
+                     [self.goal, self.pos])
 
     def draw_loss(self, img, pos, goal):
         img = self.draw_target(img, goal)
@@ -148,15 +358,17 @@ class Engine():
         return img
 
     def render(self, img, pos, goal):
-        if self.img_cache is None:
-            self.img_cache = img.copy()
-        else:
-            self.img_cache[:] = img
-
-        img = self.img_cache
-        img = self.draw_target(img, goal)
-        img = self.draw_player(img, pos)
-        return img
+        '''
+        Draws the sprites on top of the scene image. The returned view is reused by the next frame.
+        '''
+        if self.observation is not None:
+            return self.observation.render(img, [(self.louse_sprite, goal), (self.player_sprite, pos)])
+        view = self.canvas.clear(img)
+        self.canvas.mark(self.louse_sprite.bounds(view.shape, goal))
+        view = self.draw_target(view, goal)
+        self.canvas.mark(self.player_sprite.bounds(view.shape, pos))
+        view = self.draw_player(view, pos)
+        return view
 
     def draw_player(self, img, pos):
         return self.player_sprite.draw(img, pos)
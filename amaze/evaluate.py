@@ -1,30 +1,128 @@
+from amaze.action_log import ActionLog, ActionLogWriter, SUFFIX as ACTION_LOG_SUFFIX, is_action_log
+from amaze.collision import MAX_ACTION
 from amaze.engine import Engine
+from amaze.level_index import LevelIndex, in_shard, parse_shard
 from amaze.maze import factory as maze_factory
+from amaze.maze.cache import MazeCache
+from amaze.observation import Observation
 from amaze.player.keyboardwarrior import ActionRePlayer
 from amaze.player.player import Player
+from amaze.player_host import PlayerError, PlayerHost, PlayerTimeout
+from amaze.profiler import PhaseTimer
+from amaze.recorder import VideoRecorder
+from amaze.replay import ReplayEngine
+from amaze.result_store import ResultStore, result_key
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import util
+import numpy as np
 import json
 import argparse
+import os
+import time
+
+# Relative cost of generating and playing a level of each maze type, used to schedule slow levels first
+MAZE_COST = {'CircularMaze': 3.0, 'SquareMaze': 2.0, 'HexagonalMaze': 1.0}
+
+
+def level_cost(level, num_actions=0):
+    width, height = level['maze_args'].get('size', (1024, 1024))
+    return MAZE_COST.get(level['maze'], 1.0) * width * height / 1024**2 + num_actions / 1000
+
+
+# Evaluator of the current worker process, created once by the pool initializer
+_worker_evaluator = None
+
+
+def _init_worker(visualize, maze_cache, record, record_options, profile, player_host, observation, result_store):
+    global _worker_evaluator
+    _worker_evaluator = Evaluator(visualize, maze_cache=maze_cache, record=record, record_options=record_options,
+                                  profile=profile, player_host=player_host, observation=observation,
+                                  result_store=result_store)
+    # Stop the player process of the worker before the worker exits
+    util.Finalize(_worker_evaluator, _worker_evaluator.close, exitpriority=10)
+
+
+def _evaluate_task(level, index):
+    return _worker_evaluator.evaluate_level(level, _worker_evaluator.create_player(), index=index)
+
+
+def _replay_task(level, actions, index):
+    return _worker_evaluator.replay_level(level, actions, index=index)
+
+
+def _timed_task(task, *args):
+    return _worker_evaluator.timed(task, *args)
 
 
 class Evaluator():
     MAX_STEPS = 10000
 
-    def __init__(self, visualize):
+    def __init__(self, visualize, maze_cache=None, workers=1, record=None, record_options=None, profile=False,
+                 player_host=None, observation=None, result_store=None):
+        '''
+        :param record: directory to record a video of every level to
+        :param record_options: keyword arguments of amaze.recorder.VideoRecorder
+        :param profile: time the phases of the engine and the player with an amaze.profiler.PhaseTimer per level
+        :param player_host: keyword arguments of amaze.player_host.PlayerHost to run Player in its own process,
+                            None to run it in this process
+        :param observation: observation modes of the frames passed to the player, see Observation.parse
+        :param result_store: optional amaze.result_store.ResultStore with the results of replayed actions
+        '''
         self.visualize = visualize
+        self.maze_cache = maze_cache
+        self.workers = workers
+        self.record = record
+        self.record_options = record_options or {}
+        self.profile = profile
+        self.player_host = player_host
+        self.observation = observation
+        self.result_store = result_store
+        self.host = None
+        # Seconds spent on and PhaseTimer of every level of the last evaluate_levels or replay_levels
+        self.timings = []
+        self.profiles = []
+        self.last_timer = None
+        if record is not None:
+            os.makedirs(record, exist_ok=True)
+
+    def create_maze(self, level):
+        if self.maze_cache is not None:
+            return self.maze_cache.scene(level)
+        return maze_factory(**level)
 
-    def evaluate_level(self, level, player, render=True):
-        m = maze_factory(**level)
-        e = Engine(m, visualize=self.visualize, consume_input=True, render=render)
+    def recording(self, index):
+        return self.record is not None and index is not None
+
+    def create_recorder(self, index):
+        if not self.recording(index):
+            return None
+        return VideoRecorder(os.path.join(self.record, f'level_{index:03d}.mp4'), **self.record_options)
+
+    def evaluate_level(self, level, player, render=True, index=None):
+        '''
+        :param index: index of the level, names the video when recording
+        '''
+        timer = PhaseTimer() if self.profile else None
+        self.last_timer = timer
+        forward = player.forward if timer is None else timer.wrap('player', player.forward)
+        m = self.create_maze(level)
+        recorder = self.create_recorder(index)
+        observation = Observation.parse(self.observation) if self.observation else None
+        e = Engine(m, visualize=self.visualize, consume_input=True, render=render, recorder=recorder, timer=timer,
+                   observation=observation)
 
         actions = []
 
         img, pos, status = e.forward(None)
         while status == 'RUNNING':
             try:
-                action = player.forward(img, pos)
-            except StopIteration:
+                action = forward(img, pos)
+            except (StopIteration, PlayerError):
                 status = 'GAME OVER'
                 break
+            except PlayerTimeout:
+                status = 'TIMEOUT'
+                break
 
             img, pos, status = e.forward(action)
 
@@ -33,29 +131,212 @@ class Evaluator():
             if len(actions) >= self.MAX_STEPS:
                 status = 'TIMEOUT'
 
+        if recorder is not None:
+            if status == 'YOU WON':
+                e.animate_win()
+            elif status == 'GAME OVER':
+                e.animate_loss()
+            recorder.close()
         return status, actions
 
+    def replay_level(self, level, actions, index=None):
+        if self.visualize or self.recording(index) or self.profile:
+            return self.evaluate_level(level, ActionRePlayer(actions), render=False, index=index)
+        key = None if self.result_store is None else result_key(level, actions, self.MAX_STEPS)
+        if key is None:
+            return self.simulate_level(level, actions)
+        result = self.result_store.get(key)
+        if result is None:
+            result = self.simulate_level(level, actions)
+            self.result_store.put(key, result)
+        return result
+
+    def simulate_level(self, level, actions):
+        result = ReplayEngine(self.create_maze(level), self.MAX_STEPS).replay(actions)
+        if result is not None:
+            return result
+        return self.evaluate_level(level, ActionRePlayer(actions), render=False)
+
     def load_levels(self, filename):
         with open(filename) as f:
             data = f.read()
         return [json.loads(line) for line in data.strip().splitlines()]
 
     def load_actions_list(self, filename):
+        '''
+        Loads a JSON actions file, or memory maps an action log (see amaze.action_log)
+        '''
+        if is_action_log(filename):
+            return list(ActionLog(filename))
         with open(filename) as f:
             return json.load(f)
 
-    def evaluate_levels(self, levels):
-        return [self.evaluate_level(level, Player()) for level in levels]
+    def create_player(self):
+        if self.player_host is None:
+            return Player()
+        if self.host is None:
+            self.host = PlayerHost(Player, **self.player_host)
+        return self.host.player()
+
+    def close(self):
+        '''
+        Stops the player process and closes the result store
+        '''
+        if self.host is not None:
+            self.host.close()
+            self.host = None
+        if self.result_store is not None:
+            self.result_store.close()
+
+    def timed(self, function, *args):
+        '''
+        :return: (result, seconds, timer) of function(*args), timer is the PhaseTimer of the level if profiling
+        '''
+        self.last_timer = None
+        start = time.perf_counter()
+        result = function(*args)
+        return result, time.perf_counter() - start, self.last_timer
+
+    def create_pool(self):
+        '''
+        :return: ProcessPoolExecutor of self.workers processes, each with an Evaluator with the options of this one
+        '''
+        initargs = (self.visualize, self.maze_cache, self.record, self.record_options, self.profile,
+                    self.player_host, self.observation, self.result_store)
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=initargs)
+
+    def submit_replay(self, pool, level, actions, index):
+        '''
+        Replays a level on a pool of create_pool
+
+        :return: future of (result, seconds, timer), see timed
+        '''
+        return pool.submit(_timed_task, _replay_task, level, actions, index)
+
+    def run_parallel(self, task, tasks, costs, callback=None):
+        '''
+        Runs task(*args) for every args in tasks on a process pool
+
+        :param costs: expected cost of each task, the most expensive tasks are scheduled first
+        :param callback: called with (i, result) as soon as task i is finished
+        :return: list of results in the same order as tasks, the time and timer of every task are stored in
+                 self.timings and self.profiles
+        '''
+        results = [None] * len(tasks)
+        self.timings = [None] * len(tasks)
+        self.profiles = [None] * len(tasks)
+        order = sorted(range(len(tasks)), key=lambda i: -costs[i])
+        with self.create_pool() as pool:
+            futures = {pool.submit(_timed_task, task, *tasks[i]): i for i in order}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i], self.timings[i], self.profiles[i] = future.result()
+                if callback is not None:
+                    callback(i, results[i])
+        return results
+
+    def evaluate_levels(self, levels, writer=None, indices=None):
+        '''
+        :param writer: optional ActionLogWriter the actions of every level are written to as soon as it is finished
+        :param indices: index of every level in the levels file, defaults to the position in levels
+        '''
+        indices = list(range(len(levels))) if indices is None else indices
+        callback = None
+        if writer is not None:
+            def callback(i, result):
+                writer.write(indices[i], result[1])
+        if self.workers > 1:
+            return self.run_parallel(_evaluate_task, list(zip(levels, indices)),
+                                     [level_cost(level) for level in levels], callback)
+        results = []
+        self.timings = []
+        self.profiles = []
+        for i, level in enumerate(levels):
+            result, timing, timer = self.timed(self.evaluate_level, level, self.create_player(), True, indices[i])
+            results.append(result)
+            self.timings.append(timing)
+            self.profiles.append(timer)
+            if callback is not None:
+                callback(i, results[-1])
+        return results
 
     def compute_stats(self, results):
-        nsuccess = sum(1 for (status, _) in results if status == 'YOU WON')
-        total_actions = sum(len(actions) for (_, actions) in results)
+        return self.summarize([{'status': status, 'num_actions': len(actions)} for status, actions in results])
+
+    def summarize(self, entries):
+        '''
+        Same as compute_stats, for per-level result entries as written by store_results
+        '''
+        nsuccess = sum(1 for entry in entries if entry['status'] == 'YOU WON')
+        total_actions = sum(entry['num_actions'] for entry in entries)
 
         return {'num_success': nsuccess, 'total_actions': total_actions}
 
-    def store_actions(self, results, filename):
+    def store_results(self, results, indices, filename, shard=None):
+        '''
+        Writes the status, number of actions and time of every level, the timings of the run that produced results
+        '''
+        entries = [{'level': index, 'status': status, 'num_actions': len(actions), 'time': timing}
+                   for index, (status, actions), timing in zip(indices, results, self.timings)]
+        with open(filename, 'w') as fp:
+            json.dump({'shard': shard, 'results': entries}, fp)
+
+    def profile_report(self, indices):
+        '''
+        :return: the phase timings of every level of the last run, and of all levels together
+        '''
+        total = PhaseTimer()
+        levels = []
+        for index, timer in zip(indices, self.profiles):
+            if timer is not None:
+                total.merge(timer)
+                levels.append({'level': index, 'phases': timer.report()})
+        return {'levels': levels, 'total': total.report()}
+
+    def merge_results(self, filenames):
+        '''
+        Combines the result files of all shards of a run
+
+        :return: the result entries of all levels, sorted by level
+        '''
+        entries = []
+        shards = set()
+        for filename in filenames:
+            with open(filename) as f:
+                data = json.load(f)
+            shards.add(tuple(data['shard'] or (0, 1)))
+            entries.extend(data['results'])
+        num_shards = {num_shards for _, num_shards in shards}
+        assert len(num_shards) == 1, 'All result files must be from the same number of shards'
+        num_shards = num_shards.pop()
+        assert shards == {(i, num_shards) for i in range(num_shards)} and len(filenames) == num_shards, \
+            'Every shard must be merged exactly once'
+        assert len({entry['level'] for entry in entries}) == len(entries), 'Levels may only be evaluated once'
+        return sorted(entries, key=lambda entry: entry['level'])
+
+    def optimal_actions(self, levels):
+        '''
+        Estimated minimum number of actions of every level, from the geodesic distance between start and goal.
+        None for levels where the goal can not be reached.
+        '''
+        optimal = []
+        for level in levels:
+            m = self.create_maze(level)
+            _, _, startpos, _ = m.generate()
+            distance = m.distance_field()[startpos[1], startpos[0]]
+            optimal.append(int(np.ceil(distance / MAX_ACTION)) if np.isfinite(distance) else None)
+        return optimal
+
+    def store_actions(self, results, filename, indices=None):
+        indices = range(len(results)) if indices is None else indices
+        if filename.endswith(ACTION_LOG_SUFFIX):
+            with ActionLogWriter(filename) as writer:
+                for i, (_, actions) in zip(indices, results):
+                    writer.write(i, actions)
+            return
+
         output = []
-        for i, (_, actions) in enumerate(results):
+        for i, (_, actions) in zip(indices, results):
             output.append({'level': i, 'actions': actions})
 
         with open(filename, 'w') as fp:
@@ -63,37 +344,107 @@ class Evaluator():
 
     def replay_levels(self, levels, actions_list):
         assert len(set((action['level'] for action in actions_list))) == len(actions_list), 'You can only play each level once'
+        if self.workers > 1:
+            tasks = [(levels[actions['level']], actions['actions'], actions['level']) for actions in actions_list]
+            return self.run_parallel(_replay_task, tasks,
+                                     [level_cost(level, len(actions)) for level, actions, _ in tasks])
+
         results = []
+        self.timings = []
+        self.profiles = []
 
         for actions in actions_list:
             level = levels[actions['level']]
-            p = ActionRePlayer(actions['actions'])
-            results.append(self.evaluate_level(level, p, render=False))
+            result, timing, timer = self.timed(self.replay_level, level, actions['actions'], actions['level'])
+            results.append(result)
+            self.timings.append(timing)
+            self.profiles.append(timer)
 
         return results
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('--actions', default=None)
+    parser.add_argument('--actions', default=None, help='JSON actions file or action log to replay')
     parser.add_argument('--levels', default='resource/levels.txt')
-    parser.add_argument('--output', default=None)
+    parser.add_argument('--output', default=None,
+                        help=f'File to store the actions in, an action log if it ends with {ACTION_LOG_SUFFIX}')
     parser.add_argument('--visualize', action='store_true')
+    parser.add_argument('--maze-cache', default=None, help='Directory for caching generated mazes')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes evaluating levels in parallel')
+    parser.add_argument('--optimal', action='store_true', help='Also print the estimated minimum actions per level')
+    parser.add_argument('--record', default=None, help='Directory to record a video of every level to')
+    parser.add_argument('--record-skip', type=int, default=1, help='Record every n-th frame')
+    parser.add_argument('--record-size', default=None, help='Size of the recorded videos as WIDTHxHEIGHT')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='Only evaluate shard i/N, the levels with index %% N == i')
+    parser.add_argument('--results', default=None, help='File to store the status, actions and time per level in')
+    parser.add_argument('--profile', default=None, help='File to store the time spent per phase of every level in')
+    parser.add_argument('--player-host', action='store_true', help='Run the player in its own process')
+    parser.add_argument('--step-timeout', type=float, default=None,
+                        help='Seconds the player may spend on one step with --player-host, before the level times out')
+    parser.add_argument('--level-timeout', type=float, default=None,
+                        help='Seconds the player may spend on a whole level with --player-host')
+    parser.add_argument('--observation', default=None,
+                        help="Frames passed to the player, e.g. 'crop=64,gray' or 'downsample=4' (see Observation)")
+    parser.add_argument('--result-store', default=None,
+                        help='SQLite file of replay results, levels replayed with the same actions are not simulated')
+    parser.add_argument('--result-store-size', type=int, default=100000,
+                        help='Number of results kept in the --result-store')
+    parser.add_argument('--merge', nargs='+', default=None, help='Print the stats of the --results files of all shards')
     args = parser.parse_args()
+    if args.workers > 1 and args.visualize:
+        parser.error('--visualize can only be used with a single worker')
+    if (args.step_timeout or args.level_timeout) and not args.player_host:
+        parser.error('--step-timeout and --level-timeout require --player-host')
+
+    record_options = {'frame_skip': args.record_skip}
+    if args.record_size:
+        record_options['size'] = tuple(int(v) for v in args.record_size.split('x'))
+    player_host = None
+    if args.player_host:
+        player_host = {'step_timeout': args.step_timeout, 'level_timeout': args.level_timeout}
+    maze_cache = MazeCache(args.maze_cache) if args.maze_cache else None
+    result_store = ResultStore(args.result_store, args.result_store_size) if args.result_store else None
+    ev = Evaluator(visualize=args.visualize, maze_cache=maze_cache, workers=args.workers, record=args.record,
+                   record_options=record_options, profile=args.profile is not None, player_host=player_host,
+                   observation=args.observation, result_store=result_store)
+    if args.merge:
+        print(ev.summarize(ev.merge_results(args.merge)))
+        parser.exit()
 
-    ev = Evaluator(visualize=args.visualize)
-    levels = ev.load_levels(args.levels)
+    if args.shard:
+        indices, levels = LevelIndex(args.levels).shard(args.shard)
+    else:
+        levels = ev.load_levels(args.levels)
+        indices = list(range(len(levels)))
 
     if args.actions:
         actions_list = ev.load_actions_list(args.actions)
+        if args.shard:
+            actions_list = [actions for actions in actions_list if in_shard(actions['level'], args.shard)]
 
-        results = ev.replay_levels(levels, actions_list)
+        results = ev.replay_levels(dict(zip(indices, levels)), actions_list)
+        indices = [actions['level'] for actions in actions_list]
+    elif args.output and args.output.endswith(ACTION_LOG_SUFFIX):
+        with ActionLogWriter(args.output) as writer:
+            results = ev.evaluate_levels(levels, writer, indices)
     else:
-        results = ev.evaluate_levels(levels)
+        results = ev.evaluate_levels(levels, indices=indices)
 
         if args.output:
-            ev.store_actions(results, args.output)
+            ev.store_actions(results, args.output, indices)
+
+    ev.close()
+
+    if args.results:
+        ev.store_results(results, indices, args.results, args.shard)
+    if args.profile:
+        with open(args.profile, 'w') as fp:
+            json.dump(ev.profile_report(indices), fp, indent=2)
 
     stats = ev.compute_stats(results)
 
     print(stats)
+    if args.optimal:
+        print({'optimal_actions': ev.optimal_actions(levels)})
@@ -0,0 +1,64 @@
+import json
+import os
+import numpy as np
+
+
+def parse_shard(text):
+    '''
+    :param text: shard as 'i/N', with 0 <= i < N
+    :return: (i, N)
+    '''
+    shard, num_shards = (int(v) for v in text.split('/'))
+    if not 0 <= shard < num_shards:
+        raise ValueError(f'Shard {text} must be i/N with 0 <= i < N')
+    return shard, num_shards
+
+
+def in_shard(index, shard):
+    '''
+    Levels are assigned round robin, level index belongs to shard index % N
+    '''
+    return index % shard[1] == shard[0]
+
+
+class LevelIndex(object):
+    '''
+    Byte offsets of the lines of a levels file, one JSON level per line.
+
+    Building the index scans the file for newlines without parsing it, so reading a few levels only parses
+    their lines.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        size = os.path.getsize(filename)
+        data = np.memmap(filename, dtype=np.uint8, mode='r') if size else np.zeros(0, dtype=np.uint8)
+        newlines = np.flatnonzero(data == ord('\n'))
+        starts = np.concatenate([[0], newlines + 1])
+        ends = np.concatenate([newlines, [size]])
+        # Skip lines holding nothing but whitespace
+        text = np.concatenate([[0], np.cumsum(~np.isin(data, list(b' \t\r\n')))])
+        keep = text[ends] > text[starts]
+        self.offsets = np.stack([starts[keep], ends[keep]], axis=-1).astype(np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def load(self, indices):
+        '''
+        :return: the levels at indices, in the same order
+        '''
+        levels = []
+        with open(self.filename, 'rb') as f:
+            for i in indices:
+                start, end = self.offsets[i].tolist()
+                f.seek(start)
+                levels.append(json.loads(f.read(end - start)))
+        return levels
+
+    def shard(self, shard):
+        '''
+        :param shard: (i, N)
+        :return: (indices, levels) of the levels in shard i of N
+        '''
+        indices = list(range(shard[0], len(self), shard[1]))
+        return indices, self.load(indices)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from typing import Dict, Optional, Tuple
+from amaze.collision import PackedMask
+from amaze.engine import Engine
+from amaze.maze import factory as maze_factory
+from amaze.maze.compact import rgb_view
+from amaze.maze.distance import geodesic_distance
+from amaze.types import MazeImage, MazeMask, StartPos, GoalPos
+
+# Bump whenever a maze generator changes its output, this invalidates every cached level
+CACHE_VERSION = 2
+
+Generated = Tuple[MazeImage, MazeMask, StartPos, GoalPos]
+
+
+def level_key(level: Dict, version: int = CACHE_VERSION) -> str:
+    '''
+    Canonical hash of a level spec. Only the maze type and its arguments are part of the key,
+    so extra metadata on a level line does not invalidate the cache.
+    '''
+    spec = {'maze': level['maze'], 'maze_args': level['maze_args'], 'version': version}
+    data = json.dumps(spec, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class CachedMaze(object):
+    '''
+    Scene that loads its generated maze from a MazeCache, generating and storing it on a miss.
+    '''
+    static = True
+
+    def __init__(self, cache, level: Dict):
+        self.cache = cache
+        self.level = level
+        self.img = None
+        self.mask = None
+
+    def generate(self) -> Generated:
+        self.img, self.mask, startpos, goalpos = self.cache.get(self.level)
+        return self.img, self.mask, startpos, goalpos
+
+    def update(self) -> Tuple[MazeImage, MazeMask]:
+        return self.img, self.mask
+
+    def distance_field(self, radius: int = Engine.PLAYER_RADIUS, downsample: int = 1) -> np.ndarray:
+        return self.cache.distance_field(self.level, radius, downsample)
+
+
+class MazeCache(object):
+    '''
+    On-disk cache of generated mazes.
+
+    Every level is stored in its own directory as uncompressed .npy files, which are memory mapped
+    read-only when loaded. Gray images are stored with one channel and masks bit-packed, see
+    amaze.maze.compact.
+    '''
+    def __init__(self, directory: str, version: int = CACHE_VERSION):
+        self.directory = directory
+        self.version = version
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, level: Dict) -> str:
+        return os.path.join(self.directory, level_key(level, self.version))
+
+    def load(self, level: Dict) -> Optional[Generated]:
+        path = self.path(level)
+        if not os.path.isdir(path):
+            return None
+        img = np.load(os.path.join(path, 'img.npy'), mmap_mode='r')
+        mask = np.load(os.path.join(path, 'mask.npy'), mmap_mode='r')
+        points = np.load(os.path.join(path, 'points.npy'))
+        if img.ndim == 2:
+            img = rgb_view(img)
+        return img, PackedMask(mask, img.shape[1]), points[0], points[1]
+
+    def store(self, level: Dict, generated: Generated):
+        img, mask, startpos, goalpos = generated
+        path = self.path(level)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        if img.strides[-1] == 0:
+            # A gray image broadcast to 3 channels
+            img = img[..., 0]
+        if not isinstance(mask, PackedMask):
+            mask = PackedMask.pack(mask)
+        np.save(os.path.join(tmp, 'img.npy'), np.ascontiguousarray(img))
+        np.save(os.path.join(tmp, 'mask.npy'), mask.bits)
+        np.save(os.path.join(tmp, 'points.npy'), np.array([startpos, goalpos], dtype=np.int64))
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another process stored the same level first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def get(self, level: Dict) -> Generated:
+        generated = self.load(level)
+        if generated is None:
+            self.store(level, maze_factory(**level).generate())
+            generated = self.load(level)
+        return generated
+
+    def distance_field(self, level: Dict, radius: int = Engine.PLAYER_RADIUS, downsample: int = 1) -> np.ndarray:
+        '''
+        Geodesic distance to the goal of a level, see amaze.maze.distance.geodesic_distance
+        '''
+        filename = os.path.join(self.path(level), f'distance_{radius}_{downsample}.npy')
+        if not os.path.exists(filename):
+            _, mask, _, goalpos = self.get(level)
+            tmp = f'{filename}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, geodesic_distance(mask, goalpos, radius, downsample))
+            os.replace(tmp, filename)
+        return np.load(filename, mmap_mode='r')
+
+    def scene(self, level: Dict) -> CachedMaze:
+        return CachedMaze(self, level)
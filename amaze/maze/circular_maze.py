@@ -1,153 +1,215 @@
 import numpy as np
 import random
+import time
 from PIL import ImageDraw, Image
-from collections import defaultdict
-from typing import Tuple
+from typing import List, Tuple
 import cv2
-from amaze.maze.maze_util import int_divide_tuple, add_tuples, convert_tuple_to, scale_tuple, subtract_tuples
-
-class Sector():
-    def __init__(self, level, sector):
-        self.neighbors = []
-        self.level = level
-        self.sector = sector
-        self.visited = False
-
-    def join(self, other):
-        if self == other:
-            return
-        elif other in self.neighbors:
-            return
-        else:
-            self.neighbors.append(other)
-            other.neighbors.append(self)
-
-    def center(self, r):
-        arch = 2*np.pi / (2**(self.level+1))
-        phi = (self.sector * 2 + 1) * arch
-        r = (self.level + 0.5) * r
-        return convert_tuple_to((np.sin(phi)*r, -np.cos(phi)*r), int)
-
-    def __str__(self):
-        return f'{self.level}-{self.sector}-{self.visited}'
-
-    def __repr__(self):
-        return str(self)
-
-class CircularMaze():
-    def __init__(self, seed: int = 42, size: Tuple[int, int] = (1024, 1024), num_levels: int = 7):
+from amaze.maze.compact import compact_scene
+from amaze.maze.distance import DistanceField
+from amaze.types import MazeImage, MazeMask, StartPos, GoalPos
+
+# Sectors are numbered ring by ring from the centre, paths are (sector, next sector) edges in traversal order
+Neighbors = List[List[int]]
+Paths = List[Tuple[int, int]]
+
+
+class CircularMaze(DistanceField):
+    static = True
+
+    def __init__(self, seed: int = 42, size: Tuple[int, int] = (1024, 1024), num_levels: int = 7,
+                 min_sector_arc: float = 16, renderer: str = 'pil'):
+        '''
+        :param num_levels: number of rings around the centre
+        :param min_sector_arc: the number of sectors doubles from one ring to the next, unless that would make
+                               the sectors shorter than this many pixels
+        :param renderer: 'pil' draws the same mazes as earlier versions, 'cv2' is faster but draws slightly
+                         different walls
+        '''
+        assert renderer in ('pil', 'cv2'), f'Unknown renderer {renderer}'
         self.size = size
         self.num_levels = num_levels
         self.seed = seed
-        self.levels = defaultdict(list)
+        self.min_sector_arc = min_sector_arc
+        self.renderer = renderer
+        self.img = None
+        self.mask = None
+        self.goal = None
 
-    def generate(self):
+    def generate(self) -> Tuple[MazeImage, MazeMask, StartPos, GoalPos]:
         random.seed(self.seed)
+        center = (self.size[0] // 2, self.size[1] // 2)
+        ll = center[0] // (self.num_levels+1)  # Size of each level
+
+        ring_sizes = self.get_ring_sizes(ll)
+        offsets = np.concatenate([[0], np.cumsum(ring_sizes)])
+        neighbors = self.build_graph(ring_sizes, offsets)
+        paths = self.random_traversal(neighbors)
+
+        levels = np.repeat(np.arange(len(ring_sizes)), ring_sizes)
+        sectors = np.arange(offsets[-1]) - offsets[levels]
+        edges = np.array(paths).reshape(-1, 2)
+        if self.renderer == 'pil':
+            mask = self.render_pil(ring_sizes, levels[edges], sectors[edges], center, ll)
+        else:
+            mask = self.render_cv2(ring_sizes, levels[edges], sectors[edges], center, ll)
 
-        # Build tree
-        sectors = []
-        # Inner level where louse is
-        head = Sector(0, 0)
-        self.levels[0].append(head)
-        self.build_tree(head)
-
-        # Join sector on same level
-        for sectors in self.levels.values():
-            for i, s in enumerate(sectors):
-                s.join(sectors[i-1])
-
-        mask = np.ones(self.size) * 255
-        mask = Image.fromarray(mask)
-        draw = ImageDraw.Draw(mask)
-        center = int_divide_tuple(self.size, 2)
-        ll = int_divide_tuple(center, self.num_levels+1)  # Size of each level
-        thickness = 10
-
-        # Draw all circles and sectors
-        for i in range(self.num_levels+1):
-            offset = scale_tuple(ll, i+1)
-            tl = subtract_tuples(center, offset)
-            br = add_tuples(center, offset)
-            draw.ellipse([tl, br], outline='black', width=thickness)
-
-            num_sectors = 2**i
-            arch = 2 * np.pi / num_sectors
-            if i == 0:  # Special case for inner level
-                continue
-            for s in range(num_sectors):
-                s1 = i-0.05  # Small offset to make sure lines overlap
-                s2 = i+1.00  # Small offset to make sure lines overlap
-                phi = s * arch
-                p1 = convert_tuple_to(add_tuples((np.sin(phi)*s1*ll[0], -np.cos(phi)*s1*ll[0]), center), int)
-                p2 = convert_tuple_to(add_tuples((np.sin(phi)*s2*ll[0], -np.cos(phi)*s2*ll[0]), center), int)
-
-                draw.line([p1, p2], fill='black', width=thickness)
-
-        # Iterate and create actual mase
-        paths = self.random_traversal(head)
-        for p, travels in paths.items():
-            for t in travels:
-                if p.level == t.level:  # Open blocking wall
-                    if abs(p.sector - t.sector) != 1:
-                        s = 0
-                    else:
-                        s = max(p.sector, t.sector)
-                    arch = 2 * np.pi / (2**p.level)
-                    phi = s * arch
-                    i = p.level * ll[0]+1
-                    j = (p.level+1)*ll[0]-10
-                    p1 = convert_tuple_to(add_tuples((np.sin(phi)*i, -np.cos(phi)*i), center), int)
-                    p2 = convert_tuple_to(add_tuples((np.sin(phi)*j, -np.cos(phi)*j), center), int)
-                    draw.line([p1, p2], fill='white', width=thickness+3)
-                else:
-                    l = max(p.level, t.level)
-                    s = max(p.sector, t.sector)
-                    tl = subtract_tuples(center, scale_tuple(ll, l+0.1))
-                    br = add_tuples(center, scale_tuple(ll, l+0.1))
-                    sArch = 360 * s / (2**l)-90
-                    eArch = 360 * (s+1) / (2**l)-90
-                    a = 90*thickness / (l * ll[0] * np.pi)
-                    sArch += a
-                    eArch -= a
-                    draw.arc([tl, br], sArch, eArch, fill='white', width=thickness*3)
-
-        mask = np.array(mask)
-
-        self.img = np.expand_dims(mask, axis=-1).repeat(3, axis=-1).astype(np.uint8)
-        self.mask = (255-mask).astype(np.uint8)
-        pos = np.array(random.choice(self.levels[self.num_levels]).center(ll[0])) + np.array(center)
+        self.img, self.mask = compact_scene(mask, 255 - mask)
+        start = random.choice(range(ring_sizes[-1]))
+        pos = np.array(self.sector_center(self.num_levels, start, ring_sizes[-1], ll)) + np.array(center)
+        self.goal = center
         return self.img, self.mask, pos, center
 
-    def update(self):
+    def update(self) -> Tuple[MazeImage, MazeMask]:
         return self.img, self.mask
 
-
-    def build_tree(self, head):
-        if head.level == self.num_levels:
-            return
-        nl = head.level+1
-        rc = Sector(nl, head.sector*2 + 0)
-        lc = Sector(nl, head.sector*2 + 1)
-        head.join(rc)
-        head.join(lc)
-        self.levels[nl].append(rc)
-        self.levels[nl].append(lc)
-        self.build_tree(rc)
-        self.build_tree(lc)
-
-    def random_traversal(self, head):
-        paths = defaultdict(list)
-        stack = [head]
+    def get_ring_sizes(self, ll: int) -> List[int]:
+        ring_sizes = [1]
+        for i in range(1, self.num_levels+1):
+            doubled = 2 * ring_sizes[-1]
+            if i > 1 and 2 * np.pi * i * ll / doubled < self.min_sector_arc:
+                doubled = ring_sizes[-1]
+            ring_sizes.append(doubled)
+        return ring_sizes
+
+    def build_graph(self, ring_sizes: List[int], offsets: np.ndarray) -> Neighbors:
+        '''
+        Neighbour lists of all sectors: parent, children, then the sectors before and after on the same ring
+        '''
+        offsets = offsets.tolist()
+        neighbors = [[] for _ in range(offsets[-1])]
+        for level, num_sectors in enumerate(ring_sizes):
+            for sector in range(num_sectors):
+                node = offsets[level] + sector
+                if level > 0:
+                    split = num_sectors // ring_sizes[level-1]
+                    neighbors[node].append(offsets[level-1] + sector // split)
+                if level < self.num_levels:
+                    split = ring_sizes[level+1] // num_sectors
+                    neighbors[node].extend(offsets[level+1] + sector * split + i for i in range(split))
+                if num_sectors == 2:
+                    neighbors[node].append(offsets[level] + 1 - sector)
+                elif num_sectors > 2:
+                    ring = [(sector - 1) % num_sectors, (sector + 1) % num_sectors]
+                    if sector == num_sectors - 1:
+                        ring.reverse()
+                    neighbors[node].extend(offsets[level] + s for s in ring)
+        return neighbors
+
+    def random_traversal(self, neighbors: Neighbors) -> Paths:
+        paths = []
+        visited = bytearray(len(neighbors))
+        stack = [0]
         while stack:
             current = stack.pop()
-            current.visited = True
-            neighbors = [n for n in current.neighbors if not n.visited]
-            if not neighbors:
+            visited[current] = True
+            unvisited = [n for n in neighbors[current] if not visited[n]]
+            if not unvisited:
                 continue
-            next = random.choice(neighbors)
-            paths[current].append(next)
+            next = random.choice(unvisited)
+            paths.append((current, next))
             stack.append(current)
             stack.append(next)
         return paths
 
+    def sector_center(self, level: int, sector: int, num_sectors: int, ll: int) -> Tuple[int, int]:
+        arch = 2*np.pi / (2*num_sectors)
+        phi = (sector * 2 + 1) * arch
+        r = (level + 0.5) * ll
+        return int(np.sin(phi)*r), int(-np.cos(phi)*r)
+
+    def get_walls(self, ring_sizes: List[int], levels: np.ndarray, sectors: np.ndarray, center: Tuple[int, int],
+                  ll: int, thickness: int):
+        '''
+        Geometry of the maze, shared by the renderers
+
+        :return: (walls, same_ring, openings). walls are the radial wall segments, same_ring the radial segments
+                 opened between sectors on the same ring, and openings (level, start angle, end angle) of the
+                 arcs opened between rings, in degrees.
+        '''
+        walls = []
+        for i in range(1, self.num_levels+1):
+            phi = np.arange(ring_sizes[i]) * (2 * np.pi / ring_sizes[i])
+            s1 = i-0.05  # Small offset to make sure lines overlap
+            s2 = i+1.00
+            walls.append(np.stack([np.sin(phi)*s1*ll, -np.cos(phi)*s1*ll, np.sin(phi)*s2*ll, -np.cos(phi)*s2*ll], axis=-1))
+        walls = (np.concatenate(walls) + np.tile(center, 2)).astype(int) if walls else np.zeros((0, 4), dtype=int)
+
+        same = levels[:, 0] == levels[:, 1]
+        level, sector = levels[same, 0], sectors[same]
+        num_sectors = np.array(ring_sizes)[level]
+        s = np.where(np.abs(sector[:, 0] - sector[:, 1]) != 1, 0, sector.max(axis=1))
+        phi = s * (2 * np.pi / num_sectors)
+        i = level * ll + 1
+        j = (level + 1) * ll - 10
+        same_ring = (np.stack([np.sin(phi)*i, -np.cos(phi)*i, np.sin(phi)*j, -np.cos(phi)*j], axis=-1)
+                     + np.tile(center, 2)).astype(int)
+
+        level, s = levels[~same].max(axis=1), sectors[~same].max(axis=1)
+        num_sectors = np.array(ring_sizes)[level]
+        a = 90*thickness / (level * ll * np.pi)
+        openings = np.stack([level, 360 * s / num_sectors - 90 + a, 360 * (s+1) / num_sectors - 90 - a], axis=-1)
+        return walls, same_ring, openings
+
+    def render_pil(self, ring_sizes: List[int], levels: np.ndarray, sectors: np.ndarray, center: Tuple[int, int],
+                   ll: int) -> np.ndarray:
+        thickness = 10
+        walls, same_ring, openings = self.get_walls(ring_sizes, levels, sectors, center, ll, thickness)
+        mask = Image.new('L', (self.size[1], self.size[0]), 255)
+        draw = ImageDraw.Draw(mask)
 
+        # Draw all circles and sectors
+        for i in range(self.num_levels+1):
+            offset = ll * (i+1)
+            draw.ellipse([(center[0] - offset, center[1] - offset), (center[0] + offset, center[1] + offset)],
+                         outline='black', width=thickness)
+        for x1, y1, x2, y2 in walls.tolist():
+            draw.line([(x1, y1), (x2, y2)], fill='black', width=thickness)
+
+        # Open the walls along the paths of the maze
+        for x1, y1, x2, y2 in same_ring.tolist():
+            draw.line([(x1, y1), (x2, y2)], fill='white', width=thickness+3)
+        for l, start, end in openings.tolist():
+            offset = ll * (l+0.1)
+            draw.arc([(center[0] - offset, center[1] - offset), (center[0] + offset, center[1] + offset)],
+                     start, end, fill='white', width=thickness*3)
+        return np.array(mask)
+
+    def render_cv2(self, ring_sizes: List[int], levels: np.ndarray, sectors: np.ndarray, center: Tuple[int, int],
+                   ll: int) -> np.ndarray:
+        thickness = 10
+        walls, same_ring, openings = self.get_walls(ring_sizes, levels, sectors, center, ll, thickness)
+        mask = np.full(self.size, 255, dtype=np.uint8)
+
+        # PIL draws outlines inside the bounding box, cv2 centres them on the radius.
+        # cv2 also draws thick lines with round caps, so segments are shortened by the cap radius.
+        for i in range(self.num_levels+1):
+            cv2.circle(mask, center, ll * (i+1) - thickness // 2, 0, thickness)
+        cv2.polylines(mask, self.shorten(walls, 0, thickness // 2), False, 0, thickness)
+
+        cap = (thickness + 3) // 2 + 1
+        cv2.polylines(mask, self.shorten(same_ring, cap, cap), False, 255, thickness+3)
+        for l, start, end in openings.tolist():
+            radius = int(ll * (l+0.1)) - thickness * 3 // 2
+            cap = min(np.degrees(thickness * 3 / 2 / radius), (end - start) / 4)
+            cv2.ellipse(mask, center, (radius, radius), 0, start + cap, end - cap, 255, thickness*3)
+        return mask
+
+    def shorten(self, segments: np.ndarray, start: float, end: float) -> np.ndarray:
+        '''
+        Moves the end points of (x1, y1, x2, y2) segments towards each other, returns them as (N, 2, 2) int32
+        '''
+        p1, p2 = segments[:, :2].astype(float), segments[:, 2:].astype(float)
+        direction = (p2 - p1) / np.maximum(np.linalg.norm(p2 - p1, axis=1, keepdims=True), 1)
+        return np.stack([p1 + direction * start, p2 - direction * end], axis=1).round().astype(np.int32)
+
+
+if __name__ == '__main__':
+    # Generation time per number of rings
+    for num_levels in range(4, 15):
+        timings = []
+        for renderer in ('pil', 'cv2'):
+            maze = CircularMaze(seed=0, size=(2048, 2048), num_levels=num_levels, renderer=renderer)
+            t = time.perf_counter()
+            maze.generate()
+            timings.append(f'{renderer} {1000 * (time.perf_counter() - t):7.1f} ms')
+        print(f'num_levels {num_levels:2d}:', ', '.join(timings))
@@ -0,0 +1,19 @@
+import numpy as np
+from typing import Tuple
+from amaze.collision import PackedMask
+from amaze.types import MazeImage, MazeMask
+
+
+def rgb_view(gray: np.ndarray) -> MazeImage:
+    '''
+    Read-only 3 channel view of a gray image, the channels share the memory of gray. The renderers copy it into
+    their own buffer, which is the only place the color image is materialized.
+    '''
+    return np.broadcast_to(gray[..., None], gray.shape + (3,))
+
+
+def compact_scene(gray: np.ndarray, mask: np.ndarray) -> Tuple[MazeImage, MazeMask]:
+    '''
+    :return: (img, mask) of a maze drawn in gray, the image as rgb_view and the mask as a PackedMask
+    '''
+    return rgb_view(gray), PackedMask.pack(mask)
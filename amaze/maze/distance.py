@@ -0,0 +1,79 @@
+import numpy as np
+from amaze.collision import InflatedMask
+from amaze.engine import Engine
+
+# Offsets of the 8 neighbours, the first 4 are the 4-connected ones
+NEIGHBORS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def bfs_distance(free, seeds, connectivity=8):
+    '''
+    Breadth first search over the free pixels, one vectorized step per distance
+
+    :param free: boolean array, True where the player may be
+    :param seeds: boolean array, True where the distance is 0
+    :return: float32 array with the number of steps to the closest seed, inf where it can not be reached
+    '''
+    height, width = free.shape
+    stride = width + 2
+    # Pad with blocked pixels so neighbours never wrap around or go out of bounds
+    padded = np.zeros((height + 2, width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = free
+    padded = padded.ravel()
+    offsets = np.array([dy * stride + dx for dy, dx in NEIGHBORS[:connectivity]])
+
+    distance = np.full(padded.shape, np.inf, dtype=np.float32)
+    seeded = np.zeros_like(padded)
+    seeded.reshape(height + 2, width + 2)[1:-1, 1:-1] = seeds
+    frontier = np.flatnonzero(seeded & padded)
+    distance[frontier] = 0
+    step = 0
+    while len(frontier):
+        step += 1
+        neighbors = (frontier[:, None] + offsets).ravel()
+        neighbors = np.unique(neighbors[padded[neighbors] & np.isinf(distance[neighbors])])
+        distance[neighbors] = step
+        frontier = neighbors
+    return distance.reshape(height + 2, width + 2)[1:-1, 1:-1]
+
+
+def geodesic_distance(mask, goal, radius=Engine.PLAYER_RADIUS, downsample=1, connectivity=8):
+    '''
+    Geodesic distance from every position of the player to the goal
+
+    Positions where the player would touch a wall or the border are blocked. With 8-connectivity the distance is
+    the length of the shortest path in the max norm, the number of actions is at least distance / 5.
+
+    :param downsample: compute the field on blocks of downsample x downsample pixels. A block is free only when
+                       all its pixels are, field[y // downsample, x // downsample] is the distance of (x, y).
+    :return: float32 array with the distance in pixels, inf where the goal can not be reached
+    '''
+    height, width = mask.shape
+    blocked = InflatedMask(mask, radius).mask.astype(bool)
+    blocked[:radius] = blocked[:, :radius] = True
+    blocked[height - radius:] = blocked[:, width - radius:] = True
+
+    rows, cols = height // downsample, width // downsample
+    free = ~blocked[:rows * downsample, :cols * downsample].reshape(rows, downsample, cols, downsample).any(axis=(1, 3))
+    # Block centres within reach of the goal, the same test as Engine.check_finished
+    ys = (np.arange(rows) + 0.5) * downsample - 0.5
+    xs = (np.arange(cols) + 0.5) * downsample - 0.5
+    reach = max(10, downsample)
+    seeds = (xs[None, :] - goal[0])**2 + (ys[:, None] - goal[1])**2 < reach**2
+    return bfs_distance(free, seeds, connectivity) * downsample
+
+
+class DistanceField(object):
+    '''
+    Gives a maze a lazily computed and cached geodesic distance to the goal
+    '''
+    def distance_field(self, radius=Engine.PLAYER_RADIUS, downsample=1):
+        '''
+        :return: see geodesic_distance, generates the maze if it has not been generated yet
+        '''
+        fields = self.__dict__.setdefault('_distance_fields', {})
+        if (radius, downsample) not in fields:
+            if self.mask is None:
+                self.generate()
+            fields[radius, downsample] = geodesic_distance(self.mask, np.asarray(self.goal), radius, downsample)
+        return fields[radius, downsample]
@@ -1,32 +1,20 @@
 import cv2
 import random
 import numpy as np
-from collections import defaultdict
 from typing import List, Dict, Tuple
+from amaze.maze.compact import compact_scene
+from amaze.maze.distance import DistanceField
+from amaze.types import MazeImage, MazeMask, StartPos, GoalPos
 
 
-class Cell:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.visited = False
-        self.pos_x = x
-        if x % 2:
-            self.pos_y = y + 1 / 3
-        else:
-            self.pos_y = y
+# Cells are numbered y * num_cells + x, paths are (cell, next cell) edges in traversal order
+Neighbors = List[List[int]]
+Paths = List[Tuple[int, int]]
 
 
-Cells = List[List[Cell]]
-Paths = Dict[Cell, List[Cell]]
+class HexagonalMaze(DistanceField):
+    static = True
 
-MazeImage = np.array
-MazeMask = np.array
-StartPos = np.array
-GoalPos = np.array
-
-
-class HexagonalMaze:
     def __init__(self, size: Tuple[int, int] = (1024, 1024), num_cells: int = 10, seed: int = 42):
         self.size = size
         self.num_cells = num_cells
@@ -34,91 +22,93 @@ class HexagonalMaze:
         self.size_y = num_cells
         self.img = None
         self.mask = None
+        self.goal = None
         self.seed = seed
 
     def generate(self) -> Tuple[MazeImage, MazeMask, StartPos, GoalPos]:
         random.seed(self.seed)
-        cells = [[Cell(x, y) for x in range(self.size_x)]
-                 for y in range(self.size_y)]
-        paths = self.random_traversal(cells)
-        img = self.render(cells, paths)
-        self.mask = 255 - img.copy()
-        self.img = np.expand_dims(img, -1).repeat(3, axis=-1)
-        startpos, goalpos = self.get_start_goal(cells)
+        neighbors = [self.get_neighbors(x, y) for y in range(self.size_y) for x in range(self.size_x)]
+        paths = self.random_traversal(neighbors)
+        img = self.render(paths)
+        self.img, self.mask = compact_scene(img, 255 - img)
+        startpos, goalpos = self.get_start_goal()
+        self.goal = goalpos
         return self.img, self.mask, startpos, goalpos
 
     def update(self) -> Tuple[MazeImage, MazeMask]:
         return self.img, self.mask
 
-    def random_traversal(self, cells: Cells) -> Paths:
-        paths = defaultdict(list)
-        stack = [cells[0][0]]
+    def random_traversal(self, neighbors: Neighbors) -> Paths:
+        paths = []
+        visited = bytearray(len(neighbors))
+        stack = [0]
         while stack:
             current = stack.pop()
-            current.visited = True
-            neighbors = [n for n in self.get_neighbors(current, cells) if not n.visited]
-            if not neighbors:
+            visited[current] = True
+            unvisited = [n for n in neighbors[current] if not visited[n]]
+            if not unvisited:
                 continue
-            next = random.choice(neighbors)
-            paths[current].append(next)
+            next = random.choice(unvisited)
+            paths.append((current, next))
             stack.append(current)
             stack.append(next)
         return paths
 
-    def get_neighbors(self, cell: Cell, cells: Cells) -> List[Cell]:
+    def get_neighbors(self, x: int, y: int) -> List[int]:
         neighbors = []
-        x, y = cell.x, cell.y
         if y > 0:
-            neighbors.append(cells[y-1][x])  # top
+            neighbors.append((x, y-1))  # top
         if y < self.size_y - 1:
-            neighbors.append(cells[y+1][x])  # bottom
+            neighbors.append((x, y+1))  # bottom
         if x % 2:  # odd
-            neighbors.append(cells[y][x-1])  # top left
+            neighbors.append((x-1, y))  # top left
             if y < self.size_y - 1:
-                neighbors.append(cells[y+1][x-1])  # bottom left
+                neighbors.append((x-1, y+1))  # bottom left
             if x < self.size_x - 1:
-                neighbors.append(cells[y][x+1])  # top right
+                neighbors.append((x+1, y))  # top right
                 if y < self.size_y - 1:
-                    neighbors.append(cells[y+1][x+1])  # bottom right
+                    neighbors.append((x+1, y+1))  # bottom right
         else:  # even
             if x > 0:
-                neighbors.append(cells[y][x-1])  # bottom left
+                neighbors.append((x-1, y))  # bottom left
                 if y > 0:
-                    neighbors.append(cells[y-1][x-1])  # top left
+                    neighbors.append((x-1, y-1))  # top left
             if x < self.size_x - 1:
-                neighbors.append(cells[y][x+1]) # bottom right
+                neighbors.append((x+1, y)) # bottom right
                 if y > 0:
-                    neighbors.append(cells[y-1][x+1])  # top right
-        return neighbors
+                    neighbors.append((x+1, y-1))  # top right
+        return [ny * self.size_x + nx for nx, ny in neighbors]
 
     def get_render_sizes(self) -> Tuple[int, int]:
         cell_size = self.size[0] // self.size_x
         path_size = int(cell_size * 0.4)
         return cell_size, path_size
 
-    def render(self, cells: Cells, paths: Paths) -> MazeImage:
+    def get_cell_positions(self, cells: np.ndarray) -> np.ndarray:
+        '''
+        Pixel position of the centre of every cell id in cells
+        '''
+        cell_size, path_size = self.get_render_sizes()
+        x, y = cells % self.size_x, cells // self.size_x
+        # Odd columns are shifted down
+        pos = np.stack([x, y + (x % 2) / 3], axis=-1) * cell_size + path_size
+        return pos.astype(np.int32)
+
+    def render(self, paths: Paths) -> MazeImage:
         path_color = (255, 255, 255)
         image_size = self.size[0], self.size[1]
         img = np.zeros(shape=image_size, dtype=np.uint8)
         cell_size, path_size = self.get_render_sizes()
-        for y in range(self.size_y):
-            for x in range(self.size_x):
-                curr = cells[y][x]
-                neighbors = paths[curr]
-                start = np.array([curr.pos_x, curr.pos_y]) * cell_size + path_size
-                for n in neighbors:
-                    end = np.array([n.pos_x, n.pos_y]) * cell_size + path_size
-                    cv2.line(img, tuple(start.astype(np.int32)), tuple(end.astype(np.int32)), path_color, path_size)
+        if paths:
+            lines = self.get_cell_positions(np.array(paths))
+            cv2.polylines(img, lines, False, path_color, path_size)
         return img
 
-    def get_start_goal(self, cells: Cells) -> Tuple[StartPos, GoalPos]:
-        cell_size, path_size = self.get_render_sizes()
-        flat = [cell for row in cells for cell in row]
-        start_cell = random.choice(flat)
-        end_cell = random.choice(flat)
+    def get_start_goal(self) -> Tuple[StartPos, GoalPos]:
+        cells = range(self.size_x * self.size_y)
+        start_cell = random.choice(cells)
+        end_cell = random.choice(cells)
         while start_cell == end_cell:
-            end_cell = random.choice(flat)
-        startpos = np.array([start_cell.pos_x, start_cell.pos_y]) * cell_size + path_size
-        goalpos = np.array([end_cell.pos_x, end_cell.pos_y]) * cell_size + path_size
-        return startpos.astype(np.int32), goalpos.astype(np.int32)
-
+            end_cell = random.choice(cells)
+        startpos, goalpos = self.get_cell_positions(np.array([start_cell, end_cell]))
+        return startpos, goalpos
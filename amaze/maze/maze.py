@@ -1,12 +1,16 @@
 import cv2
 import numpy as np
-from .maze_util import generate_maze, generate_maze_image
+from .maze_util import generate_maze, WALL
 import random
 from typing import List, Tuple
 from amaze.types import MazeImage, MazeMask, StartPos, GoalPos
+from amaze.maze.compact import compact_scene
+from amaze.maze.distance import DistanceField
 
 
-class SquareMaze(object):
+class SquareMaze(DistanceField):
+    static = True
+
     def __init__(self, size: Tuple[int, int] = (1025, 1025), seed: int = 1235):
         self.mask = None
         self.img = None
@@ -21,13 +25,15 @@ class SquareMaze(object):
         scale = 32
         dimensions = [self.size[0]//scale, self.size[1]//scale]
         maze = generate_maze(dimensions)
-        mazeImg = generate_maze_image(maze, []) * 255.0
 
-        self.img = np.expand_dims(np.kron(mazeImg, np.ones((scale, scale))), axis=2).repeat(3, axis=2).astype(np.uint8)
-        self.mask = np.kron(maze, np.ones((scale, scale))).astype(np.uint8)
+        # Nearest neighbour upscaling of the cells straight into uint8
+        maze_img = np.where(maze == WALL, 0, 255).astype(np.uint8).repeat(scale, axis=0).repeat(scale, axis=1)
+        self.img, self.mask = compact_scene(maze_img, maze_img == 0)
 
         off = (scale * 3) // 2
-        return self.img, self.mask, np.array([45, 20]), np.array([self.img.shape[1]-off, self.img.shape[0]-scale])
+        self.startpos = np.array([45, 20])
+        self.goal = np.array([self.img.shape[1]-off, self.img.shape[0]-scale])
+        return self.img, self.mask, self.startpos, self.goal
 
     def update(self) -> Tuple[MazeImage, MazeMask]:
         return self.img, self.mask
@@ -2,7 +2,6 @@
 # http://sites.nd.edu/code-fair/2018/11/07/maze-generation-advanced/
 
 import numpy
-from numpy.random import random_integers as rand
 import matplotlib.pyplot as plot
 import random
 
@@ -51,70 +50,112 @@ def get_unconnected_neighbors(point, maze):
     neighbors = [add_tuples(point, d) for d in directions if is_in_bounds(add_tuples(point, d), maze.shape) and maze[add_tuples(point, int_divide_tuples(d, (2, 2)))] == WALL]
     return neighbors
 
+class LegacyRandint(object):
+    '''
+    Draws the same integers as numpy.random.randint(low, high) on the global RandomState, but from batches of raw
+    32 bit outputs of its Mersenne Twister, which is much faster than many scalar randint calls.
+    Call sync() when done to leave the global RandomState as if randint had been called.
+    '''
+    BATCH_SIZE = 4096
+
+    def __init__(self):
+        self.state = numpy.random.get_state()
+        self.raw = []
+        self.index = 0
+        self.consumed = 0
+
+    def next_uint32(self):
+        if self.index == len(self.raw):
+            self.consumed += len(self.raw)
+            self.raw = numpy.random.randint(0, 2**32, size=self.BATCH_SIZE, dtype=numpy.uint32).tolist()
+            self.index = 0
+        self.index += 1
+        return self.raw[self.index - 1]
+
+    def __call__(self, low, high):
+        # Masked rejection sampling, as numpy does for ranges below 2**32
+        rng = high - low - 1
+        if rng == 0:
+            return low
+        mask = (1 << rng.bit_length()) - 1
+        value = self.next_uint32() & mask
+        while value > rng:
+            value = self.next_uint32() & mask
+        return low + value
+
+    def sync(self):
+        numpy.random.set_state(self.state)
+        numpy.random.randint(0, 2**32, size=self.consumed + self.index, dtype=numpy.uint32)
+
+
 def generate_maze(dimensions):
-     # Since walls are 1 thick and paths are 1 thick
+    # Since walls are 1 thick and paths are 1 thick
     # and there are walls on the far and near side,
     # the dimensions of the maze must be odd
-    dimensions = add_tuples(multiply_tuples(int_divide_tuples(dimensions, (2, 2)), (2, 2)), (1, 1))
-
-    # Make the rectangular array that will represent
-    # the maze as of either zeros (path) or ones (walls)
-    # Start with no walls
-    maze = numpy.zeros(dimensions, dtype=bool)
-
-    # Make walls around the outside
-    for y in range(0, dimensions[0], 2): maze[y, :] = WALL;
-    for x in range(0, dimensions[1], 2): maze[:, x] = WALL
-
-    startPosition = (0, 1)
-    endPosition = (-1, -2)
-    
-    maze[startPosition] = 0
-    maze[endPosition] = 0
-
-    stack = [(1, 1)]
-
-    while len(stack) > 0:
-        if(rand(2) == 1): 
-            currentPosition = stack.pop()
-        else: 
-            index = rand(len(stack)) - 1
-            currentPosition = stack[index]
-            del(stack[index])
-
-        unvisitedNeighbors = [neighbor for neighbor in get_unconnected_neighbors(currentPosition, maze) if len(get_connected_neighors(neighbor, maze)) == 0]
+    rows, cols = add_tuples(multiply_tuples(int_divide_tuples(dimensions, (2, 2)), (2, 2)), (1, 1))
+
+    # Start with walls around every cell, and openings at the start and end
+    maze = numpy.zeros((rows, cols), dtype=bool)
+    maze[::2, :] = WALL
+    maze[:, ::2] = WALL
+    maze[0, 1] = PATH
+    maze[-1, -2] = PATH
+
+    # The maze is traversed as a flat array of cells, positions are flat indices into it.
+    # Steps and half steps of the directions (0, 2), (2, 0), (0, -2), (-2, 0).
+    cells = bytearray(maze.tobytes())
+    steps = (2, 2*cols, -2, -2*cols)
+    halves = (1, cols, -1, -cols)
+
+    def in_bounds(position, direction):
+        row, col = divmod(position, cols)
+        return (col + 2 < cols, row + 2 < rows, col > 2, row > 2)[direction]
+
+    def is_connected(position):
+        row, col = divmod(position, cols)
+        return (col + 2 < cols and cells[position + 1] == PATH) or \
+               (row + 2 < rows and cells[position + cols] == PATH) or \
+               (col > 2 and cells[position - 1] == PATH) or \
+               (row > 2 and cells[position - cols] == PATH)
+
+    rand = LegacyRandint()
+    stack = [cols + 1]
+
+    while stack:
+        if rand(1, 3) == 1:
+            current = stack.pop()
+        else:
+            index = rand(1, len(stack) + 1) - 1
+            current = stack[index]
+            del stack[index]
 
-        if len(unvisitedNeighbors) > 0:
-           random.shuffle(unvisitedNeighbors)
-           nextPosition = unvisitedNeighbors.pop();
+        row, col = divmod(current, cols)
+        unvisited = [(current + steps[d], d) for d, inside in enumerate((col + 2 < cols, row + 2 < rows, col > 2, row > 2))
+                     if inside and cells[current + halves[d]] == WALL and not is_connected(current + steps[d])]
 
-           if len(unvisitedNeighbors) > 0: stack.append(currentPosition)
+        if unvisited:
+            random.shuffle(unvisited)
+            following, direction = unvisited.pop()
 
-           direction = subtract_tuples(nextPosition, currentPosition);
-           halfDirection = int_divide_tuples(direction, (2, 2));
+            if unvisited:
+                stack.append(current)
 
-           for step in range(rand(3, 5)):
-               maze[add_tuples(currentPosition, halfDirection)] = PATH
+            for _ in range(rand(3, 6)):
+                cells[current + halves[direction]] = PATH
 
-               currentPosition = nextPosition
-               nextPosition = add_tuples(currentPosition, direction)
+                current = following
+                following = current + steps[direction]
 
-               stack.append(currentPosition)
-               if not is_in_bounds(nextPosition, dimensions) or len(get_connected_neighors(nextPosition, maze)) > 0:
-                   break;
+                stack.append(current)
+                if not in_bounds(current, direction) or is_connected(following):
+                    break
 
-    return maze
+    rand.sync()
+    return numpy.frombuffer(bytes(cells), dtype=bool).reshape(rows, cols).copy()
 
 def generate_maze_image(maze, solution):
     dimensions = maze.shape
-    image = numpy.zeros(dimensions, dtype=float)
-    image[:, :] = 0.0
-    for x in range(maze.shape[0]):
-        for y in range(maze.shape[1]):
-            if maze[x, y] == WALL:
-                image[x, y] = 0.0
-            else: 
-                image[x, y] = 1.0
+    image = numpy.where(maze == WALL, 0.0, 1.0)
     for point in solution:
         if point[0] < 0 or point[1] < 0 or point[0] >= dimensions[0] or point[1] >= dimensions[1]:
            continue;
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+from amaze.engine import Canvas
+
+
+class Observation(object):
+    '''
+    Renders what the player sees into a small reusable buffer, instead of the full color frame.
+
+    The background is converted and downsampled once per scene image, sprites use converted and downsampled
+    frames from the sprite registry. With a crop only the K x K pixels around the player are copied and drawn,
+    pixels outside the scene are black like the walls.
+    '''
+    def __init__(self, crop=None, gray=False, downsample=1):
+        '''
+        :param crop: size K of the square centred on the player, in downsampled pixels. None for the whole scene.
+        :param gray: render a single gray channel
+        :param downsample: shrink the scene by this factor
+        '''
+        assert crop is None or crop > 0, 'crop must be positive'
+        assert downsample >= 1, 'downsample must be at least 1'
+        self.crop = crop
+        self.gray = gray
+        self.downsample = downsample
+        self.source = None
+        self.background = None
+        self.canvas = Canvas()
+        self.buffer = None
+
+    @classmethod
+    def parse(cls, text):
+        '''
+        :param text: comma separated modes, 'full', 'gray', 'crop=K' and 'downsample=s', e.g. 'crop=64,gray'
+        '''
+        kwargs = {}
+        for mode in text.split(','):
+            name, _, value = mode.strip().partition('=')
+            if name == 'gray':
+                kwargs['gray'] = True
+            elif name in ('crop', 'downsample'):
+                kwargs[name] = int(value)
+            elif name != 'full':
+                raise ValueError(f'Unknown observation mode {mode}')
+        return cls(**kwargs)
+
+    def invalidate(self):
+        '''
+        Converts the scene image again on the next render, for images that were changed in place
+        '''
+        self.source = None
+        self.canvas.invalidate()
+
+    def convert(self, img):
+        if self.gray:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if self.downsample > 1:
+            height, width = img.shape[:2]
+            img = cv2.resize(img, (width // self.downsample, height // self.downsample),
+                             interpolation=cv2.INTER_AREA)
+        return img
+
+    def render(self, img, sprites):
+        '''
+        :param img: the scene image
+        :param sprites: list of (sprite, pos) drawn in order
+        :return: the observation, the buffer is reused by the next render
+        '''
+        if img is not self.source:
+            self.background = self.convert(img)
+            self.source = img
+        if self.crop is None:
+            return self.render_full(sprites)
+        return self.render_crop(sprites)
+
+    def render_full(self, sprites):
+        view = self.canvas.clear(self.background)
+        for sprite, pos in sprites:
+            self.canvas.mark(sprite.bounds(view.shape, pos, self.downsample, self.gray))
+            self.draw(view, sprite, pos, (0, 0))
+        return view
+
+    def render_crop(self, sprites):
+        background = self.background
+        shape = (self.crop, self.crop) + background.shape[2:]
+        if self.buffer is None or self.buffer.shape != shape:
+            self.buffer = np.zeros(shape, dtype=np.uint8)
+        # Centre of the crop is the player, the last sprite
+        x, y = (int(v) // self.downsample - self.crop // 2 for v in sprites[-1][1])
+        height, width = background.shape[:2]
+        y1, y2 = max(0, y), min(height, y + self.crop)
+        x1, x2 = max(0, x), min(width, x + self.crop)
+        if (y1, x1, y2, x2) != (y, x, y + self.crop, x + self.crop):
+            self.buffer[:] = 0
+        if y2 > y1 and x2 > x1:
+            self.buffer[y1 - y:y2 - y, x1 - x:x2 - x] = background[y1:y2, x1:x2]
+        for sprite, pos in sprites:
+            self.draw(self.buffer, sprite, pos, (x, y))
+        return self.buffer
+
+    def draw(self, view, sprite, pos, origin):
+        x, y = sprite.corner(pos, self.downsample)
+        sprite.frame(self.downsample, self.gray).draw(view, x - origin[0], y - origin[1])
+        sprite.advance()
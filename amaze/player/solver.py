@@ -0,0 +1,98 @@
+'''
+Reference solver that finds the shortest action sequence of a level.
+
+It runs a breadth first search over player positions. The moves allowed from every position are found with the
+engine's own collision test, computed for the whole mask at once for each of the 121 actions, so the solutions
+replay exactly in the evaluator.
+'''
+import argparse
+import functools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from amaze.collision import MAX_ACTION, collision_map
+from amaze.engine import Engine
+from amaze.maze import factory as maze_factory
+from amaze.maze.cache import MazeCache
+
+ACTIONS = np.array([(dx, dy) for dy in range(-MAX_ACTION, MAX_ACTION + 1) for dx in range(-MAX_ACTION, MAX_ACTION + 1)])
+
+
+class Solver(object):
+    PLAYER_RADIUS = Engine.PLAYER_RADIUS
+
+    def __init__(self, max_steps=10000):
+        self.max_steps = max_steps
+
+    def solve(self, scene):
+        '''
+        :param scene: maze to solve, it is generated by the solver
+        :return: list of [dx, dy] actions reaching the goal in as few steps as possible, None if it can not be reached
+        '''
+        _, mask, startpos, goalpos = scene.generate()
+        height, width = mask.shape
+        allowed = np.stack([~collision_map(mask, action, self.PLAYER_RADIUS).ravel() for action in ACTIONS])
+        offsets = ACTIONS[:, 1] * width + ACTIONS[:, 0]
+
+        ys, xs = np.mgrid[:height, :width]
+        # Same test as Engine.check_finished
+        finished = (np.hypot(xs - goalpos[0], ys - goalpos[1]) < 10).ravel()
+
+        # Index of the action leading to every reached position, -1 for positions not reached yet
+        parent = np.full(height * width, -1, dtype=np.int16)
+        start = startpos[1] * width + startpos[0]
+        parent[start] = len(ACTIONS)
+        frontier = np.array([start])
+        for _ in range(self.max_steps - 1):
+            moves, sources = np.nonzero(allowed[:, frontier])
+            reached = frontier[sources] + offsets[moves]
+            reached, first = np.unique(reached, return_index=True)
+            new = parent[reached] < 0
+            reached, moves = reached[new], moves[first[new]]
+            if not len(reached):
+                return None
+            parent[reached] = moves
+            done = reached[finished[reached]]
+            if len(done):
+                return self.backtrack(parent, offsets, done[0], start)
+            frontier = reached
+        return None
+
+    def backtrack(self, parent, offsets, end, start):
+        actions = []
+        while end != start:
+            actions.append(ACTIONS[parent[end]].tolist())
+            end -= offsets[parent[end]]
+        return actions[::-1]
+
+
+def solve_level(level, max_steps=10000, maze_cache=None):
+    scene = maze_cache.scene(level) if maze_cache is not None else maze_factory(**level)
+    return Solver(max_steps).solve(scene)
+
+
+if __name__ == '__main__':
+    from amaze.evaluate import Evaluator
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--levels', default='resource/levels.txt')
+    parser.add_argument('--output', default='resource/actions.json')
+    parser.add_argument('--maze-cache', default=None, help='Directory for caching generated mazes')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes solving levels in parallel')
+    args = parser.parse_args()
+
+    ev = Evaluator(visualize=False)
+    maze_cache = MazeCache(args.maze_cache) if args.maze_cache else None
+    solve = functools.partial(solve_level, max_steps=ev.MAX_STEPS, maze_cache=maze_cache)
+    with ProcessPoolExecutor(args.workers) as pool:
+        solutions = list(pool.map(solve, ev.load_levels(args.levels)))
+
+    results = []
+    for i, actions in enumerate(solutions):
+        if actions is None:
+            print(f'Level {i}: no solution')
+            results.append(('GAME OVER', []))
+        else:
+            print(f'Level {i}: {len(actions)} actions')
+            results.append(('YOU WON', actions))
+    ev.store_actions(results, args.output)
+    print(ev.compute_stats(results))
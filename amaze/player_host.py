@@ -0,0 +1,169 @@
+'''
+Runs a player in its own process.
+
+Frames are written to a ring buffer of slots in shared memory, only the slot, shape and position of a frame and
+the resulting action are sent over a pipe. A player that does not answer within the step or level deadline is
+killed and raises PlayerTimeout, one that crashes raises PlayerError. The host restarts the process for the next
+level in both cases.
+'''
+import multiprocessing as mp
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class PlayerTimeout(Exception):
+    pass
+
+
+class PlayerError(Exception):
+    pass
+
+
+def _detach(memory):
+    try:
+        memory.close()
+    except BufferError:
+        # The player still holds a frame, the mapping is released when the process exits
+        pass
+
+
+def _host_main(conn, player_factory, memory_name):
+    memory = shared_memory.SharedMemory(memory_name)
+    player = None
+    while True:
+        message = conn.recv()
+        command = message[0]
+        if command == 'close':
+            break
+        elif command == 'memory':
+            _detach(memory)
+            memory = shared_memory.SharedMemory(message[1])
+        elif command == 'reset':
+            player = player_factory()
+        elif command == 'forward':
+            _, offset, shape, pos = message
+            img = None if shape is None else np.ndarray(shape, dtype=np.uint8, buffer=memory.buf, offset=offset)
+            try:
+                conn.send(('action', player.forward(img, np.array(pos))))
+            except StopIteration:
+                conn.send(('stop',))
+            except Exception:
+                conn.send(('error', traceback.format_exc()))
+            # Do not keep the frame alive, so the memory can be closed
+            del img
+    _detach(memory)
+
+
+class PlayerHost(object):
+    '''
+    Player process with a shared memory ring buffer of frames
+    '''
+    def __init__(self, player_factory, step_timeout=None, level_timeout=None, slots=2,
+                 frame_shape=(1024, 1024, 3)):
+        '''
+        :param player_factory: called without arguments in the player process to create the player of a level
+        :param step_timeout: seconds a player may spend on one forward
+        :param level_timeout: seconds a player may spend on all forwards of a level together
+        :param slots: number of frames in the ring buffer, a player may keep using a frame for slots - 1 more steps
+        :param frame_shape: initial size of a slot, grown when a larger frame arrives
+        '''
+        self.player_factory = player_factory
+        self.step_timeout = step_timeout
+        self.level_timeout = level_timeout
+        self.slots = slots
+        self.slot_size = int(np.prod(frame_shape))
+        self.memory = shared_memory.SharedMemory(create=True, size=self.slot_size * slots)
+        self.slot = 0
+        self.process = None
+        self.conn = None
+        self.deadline = None
+
+    def start(self):
+        self.conn, child_conn = mp.Pipe()
+        self.process = mp.Process(target=_host_main, args=(child_conn, self.player_factory, self.memory.name),
+                                  daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+        self.process = None
+
+    def player(self):
+        '''
+        Starts a level with a new player
+
+        :return: object with the forward(img, pos) of the player
+        '''
+        if self.process is None or not self.process.is_alive():
+            self.kill()
+            self.start()
+        self.conn.send(('reset',))
+        self.deadline = None if self.level_timeout is None else time.monotonic() + self.level_timeout
+        return self
+
+    def write_frame(self, img):
+        '''
+        :return: (offset, shape) of img in the shared memory
+        '''
+        if img is None:
+            return 0, None
+        if img.nbytes > self.slot_size:
+            self.resize(img.nbytes)
+        offset = self.slot * self.slot_size
+        np.ndarray(img.shape, dtype=np.uint8, buffer=self.memory.buf, offset=offset)[:] = img
+        self.slot = (self.slot + 1) % self.slots
+        return offset, img.shape
+
+    def resize(self, slot_size):
+        memory = shared_memory.SharedMemory(create=True, size=slot_size * self.slots)
+        self.conn.send(('memory', memory.name))
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = memory
+        self.slot_size = slot_size
+
+    def timeout(self):
+        timeouts = []
+        if self.step_timeout is not None:
+            timeouts.append(self.step_timeout)
+        if self.deadline is not None:
+            timeouts.append(self.deadline - time.monotonic())
+        return max(0, min(timeouts)) if timeouts else None
+
+    def forward(self, img, pos):
+        assert img is None or img.dtype == np.uint8, 'Frames must have dtype np.uint8'
+        offset, shape = self.write_frame(img)
+        try:
+            self.conn.send(('forward', offset, shape, tuple(int(v) for v in pos)))
+            if not self.conn.poll(self.timeout()):
+                self.kill()
+                raise PlayerTimeout('Player did not return an action in time')
+            reply = self.conn.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise PlayerError('Player process died')
+        if reply[0] == 'stop':
+            raise StopIteration
+        if reply[0] == 'error':
+            raise PlayerError(reply[1])
+        return reply[1]
+
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            self.conn.send(('close',))
+            self.process.join(1)
+        self.kill()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,79 @@
+import time
+
+# Histogram bucket b counts the calls that took less than 2**b nanoseconds
+NUM_BUCKETS = 48
+
+
+class PhaseTimer(object):
+    '''
+    Accumulates the time spent in phases of the game loop with time.perf_counter_ns.
+
+    Every phase has a call count, a total and a histogram with power of two buckets. Functions are timed by
+    wrapping them with wrap(), so objects that are not profiled do not pay for it.
+    '''
+    def __init__(self):
+        self.counts = {}
+        self.totals = {}
+        self.histograms = {}
+
+    def init_phase(self, phase):
+        if phase not in self.counts:
+            self.counts[phase] = 0
+            self.totals[phase] = 0
+            self.histograms[phase] = [0] * NUM_BUCKETS
+
+    def add(self, phase, ns):
+        self.init_phase(phase)
+        self.counts[phase] += 1
+        self.totals[phase] += ns
+        self.histograms[phase][min(ns.bit_length(), NUM_BUCKETS - 1)] += 1
+
+    def wrap(self, phase, function):
+        '''
+        :return: function, timed as phase
+        '''
+        perf_counter_ns = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(phase, perf_counter_ns() - start)
+        return timed
+
+    def merge(self, other):
+        '''
+        Adds the timings of another PhaseTimer to this one
+        '''
+        for phase, count in other.counts.items():
+            self.init_phase(phase)
+            self.counts[phase] += count
+            self.totals[phase] += other.totals[phase]
+            self.histograms[phase] = [a + b for a, b in zip(self.histograms[phase], other.histograms[phase])]
+        return self
+
+    def percentile(self, phase, q):
+        '''
+        :return: upper bound in nanoseconds of the q-th percentile, from the histogram
+        '''
+        rank = q / 100 * self.counts[phase]
+        seen = 0
+        for bucket, count in enumerate(self.histograms[phase]):
+            seen += count
+            if count and seen >= rank:
+                return 2**bucket
+        return 2**(NUM_BUCKETS - 1)
+
+    def report(self):
+        '''
+        :return: {phase: {'count', 'total_ms', 'mean_us', 'p50_us', 'p99_us'}}, the percentiles are power of two
+                 upper bounds
+        '''
+        return {phase: {
+            'count': count,
+            'total_ms': self.totals[phase] / 1e6,
+            'mean_us': self.totals[phase] / count / 1e3,
+            'p50_us': self.percentile(phase, 50) / 1e3,
+            'p99_us': self.percentile(phase, 99) / 1e3,
+        } for phase, count in self.counts.items()}
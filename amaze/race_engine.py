@@ -0,0 +1,128 @@
+import numpy as np
+from amaze.collision import exact_collisions, in_range
+from amaze.engine import Canvas, Engine, create_sprite, scene_changed
+
+
+class RaceEngine(object):
+    '''
+    K players racing on one maze.
+
+    The scene is generated once and all players start at its start position. Positions are one (K, 2) array, so
+    the collision and goal tests of a tick are array operations over all players still racing. A player keeps
+    the status it finished with, its actions are ignored from then on. All players are drawn on one frame.
+    '''
+    PLAYER_RADIUS = Engine.PLAYER_RADIUS
+
+    def __init__(self, scene, num_players, render=True, max_steps=10000):
+        '''
+        :param render: return a rendered frame from forward
+        :param max_steps: number of ticks before the players still racing time out
+        '''
+        self.scene = scene
+        self.num_players = num_players
+        self.render_scene = render
+        self.max_steps = max_steps
+        self.initialized = False
+        self.img = None
+        self.mask = None
+        self.scene_version = None
+        self.goal = None
+        self.pos = np.zeros((num_players, 2), dtype=np.int64)
+        self.statuses = np.full(num_players, 'RUNNING', dtype=object)
+        # Tick every player finished in, -1 while racing
+        self.finish_steps = np.full(num_players, -1, dtype=np.int64)
+        self.steps = 0
+        self.canvas = Canvas()
+        self.louse_sprite = create_sprite('louse')
+        self.player_sprite = create_sprite('player')
+        self.loss_sprite = create_sprite('loss')
+
+    def forward(self, actions):
+        '''
+        Runs one tick of the race
+
+        :param actions: array of shape (K, 2) with the action of every player. Pass None to initialize.
+        :return: (view, positions, statuses). view is None unless rendering, statuses is an object array with
+                 'RUNNING' for the players still racing.
+        '''
+        if actions is None:
+            assert not self.initialized, "Can't initialize game twice"
+            self.initialized = True
+            self.img, self.mask, startpos, self.goal = self.scene.generate()
+            self.scene_version = getattr(self.scene, 'version', None)
+            self.goal = np.asarray(self.goal)
+            self.pos[:] = startpos
+        elif self.running().any():
+            self.update_scene()
+            racing = np.flatnonzero(self.running())
+            actions = self.validate_actions(actions)[racing]
+            pos = self.pos[racing]
+            next_pos = pos + actions
+            collided = self.check_collisions(pos, next_pos)
+            finished = ~collided & (np.linalg.norm(next_pos - self.goal, axis=-1) < 10)
+            self.pos[racing] = next_pos
+            self.steps += 1
+            statuses = np.where(collided, 'GAME OVER', np.where(finished, 'YOU WON', 'RUNNING')).astype(object)
+            if self.steps >= self.max_steps:
+                statuses[:] = 'TIMEOUT'
+            self.statuses[racing] = statuses
+            self.finish_steps[racing[statuses != 'RUNNING']] = self.steps
+
+        view = self.render() if self.render_scene else None
+        return view, self.pos.copy(), self.statuses.copy()
+
+    def running(self):
+        return self.statuses == 'RUNNING'
+
+    def update_scene(self):
+        if scene_changed(self.scene, self.scene_version):
+            self.img, self.mask = self.scene.update()
+            self.canvas.invalidate()
+            self.scene_version = getattr(self.scene, 'version', None)
+
+    def validate_actions(self, actions):
+        assert isinstance(actions, np.ndarray), 'Actions must be a numpy array'
+        assert actions.shape == (self.num_players, 2), 'Actions must have shape (num_players, 2)'
+        assert np.issubdtype(actions.dtype, np.integer), 'Actions must be integers'
+        assert np.all(in_range(actions[self.running()])), 'Action must be withing +- 5 in both dimensions'
+        return actions
+
+    def check_collisions(self, pos, next_pos):
+        return exact_collisions(self.mask, pos, next_pos, self.PLAYER_RADIUS)
+
+    def ranking(self):
+        '''
+        :return: indices of the players that won, in the order they reached the goal
+        '''
+        won = np.flatnonzero(self.statuses == 'YOU WON')
+        return won[np.argsort(self.finish_steps[won], kind='stable')].tolist()
+
+    def render(self):
+        view = self.canvas.clear(self.img)
+        self.canvas.mark(self.louse_sprite.bounds(view.shape, self.goal))
+        self.louse_sprite.draw(view, self.goal)
+        for sprite, players in ((self.loss_sprite, self.statuses == 'GAME OVER'),
+                                (self.player_sprite, self.statuses != 'GAME OVER')):
+            for pos in self.pos[players]:
+                self.canvas.mark(sprite.bounds(view.shape, pos))
+                sprite.draw(view, pos)
+        return view
+
+
+class Race(object):
+    '''
+    Game loop of a race, every player gets the shared frame and its own position
+    '''
+    def __init__(self, engine, players):
+        assert len(players) == engine.num_players, 'Need one player per racing position'
+        self.engine = engine
+        self.players = players
+
+    def run(self):
+        view, positions, statuses = self.engine.forward(None)
+        actions = np.zeros((len(self.players), 2), dtype=np.int64)
+        while np.any(statuses == 'RUNNING'):
+            for i in np.flatnonzero(statuses == 'RUNNING'):
+                actions[i] = self.players[i].forward(view, positions[i])
+            view, positions, statuses = self.engine.forward(actions)
+        return statuses, self.engine.ranking()
@@ -0,0 +1,85 @@
+import queue
+import threading
+import cv2
+
+
+class VideoRecorder(object):
+    '''
+    Writes rendered frames to a video file from a background thread.
+
+    Frames are passed to the writer thread through a bounded queue. When the queue is full the frame is dropped,
+    so a slow encoder never stalls the game loop.
+    '''
+    def __init__(self, filename, fps=50, frame_skip=1, size=None, queue_size=64, fourcc='mp4v'):
+        '''
+        :param fps: frame rate of the video, the win and loss animations are drawn for 50 fps
+        :param frame_skip: only every frame_skip-th frame is recorded
+        :param size: (width, height) of the video, defaults to the size of the first frame
+        :param queue_size: number of frames waiting for the writer thread before frames are dropped
+        '''
+        assert frame_skip >= 1, 'frame_skip must be at least 1'
+        self.filename = filename
+        self.fps = fps
+        self.frame_skip = frame_skip
+        self.size = size
+        self.fourcc = fourcc
+        self.frames = 0
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        '''
+        Queues a copy of frame, the caller may reuse the frame buffer afterwards
+        '''
+        index = self.frames
+        self.frames += 1
+        if index % self.frame_skip:
+            return
+        if self.queue.full():
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(frame.copy())
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        writer = None
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            if writer is None:
+                size = self.size or (frame.shape[1], frame.shape[0])
+                writer = cv2.VideoWriter(self.filename, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, size)
+                if not writer.isOpened():
+                    self.error = IOError(f'Could not open video writer for {self.filename}')
+                    continue
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            writer.write(frame)
+            self.written += 1
+        if writer is not None:
+            writer.release()
+
+    def close(self):
+        '''
+        Waits for the queued frames to be written and closes the file
+        '''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
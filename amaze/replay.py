@@ -0,0 +1,63 @@
+import numpy as np
+from amaze.collision import in_range, swept_collisions
+from amaze.engine import Engine
+
+
+class ReplayEngine(object):
+    '''
+    Replays a whole action sequence at once.
+
+    Gives the same (status, actions) as stepping an Engine with an ActionRePlayer, but validates all actions
+    in one go, computes every position with a cumulative sum and finds the first collision or win with
+    vectorized collision tests.
+    '''
+    PLAYER_RADIUS = Engine.PLAYER_RADIUS
+    CHUNK_SIZE = 512
+
+    def __init__(self, scene, max_steps):
+        self.scene = scene
+        self.max_steps = max_steps
+
+    def replay(self, actions):
+        '''
+        :param actions: sequence of [dx, dy] actions
+        :return: (status, actions) or None if the actions can not be replayed vectorized,
+                 in which case they must be replayed step by step with an Engine
+        '''
+        array = np.asarray(actions) if len(actions) else np.zeros((0, 2), dtype=np.int64)
+        if array.ndim != 2 or array.shape[1] != 2 or not np.issubdtype(array.dtype, np.integer):
+            return None
+
+        invalid = np.flatnonzero(~in_range(array))
+        num_valid = invalid[0] if len(invalid) else len(array)
+        num_steps = min(num_valid, self.max_steps)
+
+        _, mask, pos, goal = self.scene.generate()
+        goal = np.asarray(goal)
+        pos = np.asarray(pos, dtype=np.int64)
+
+        for start in range(0, num_steps, self.CHUNK_SIZE):
+            steps = array[start:min(start + self.CHUNK_SIZE, num_steps)].astype(np.int64)
+            positions = np.concatenate([pos[None], pos + np.cumsum(steps, axis=0)])
+            collided, exact = swept_collisions(mask, positions[:-1], positions[1:], self.PLAYER_RADIUS)
+            finished = np.linalg.norm(positions[1:] - goal, axis=1) < 10
+            done = np.flatnonzero(collided | finished | ~exact)
+            if len(done):
+                step = done[0]
+                if not exact[step]:
+                    return None
+                status = 'GAME OVER' if collided[step] else 'YOU WON'
+                return self.result(status, actions, start + step + 1)
+            pos = positions[-1]
+
+        if num_steps == self.max_steps:
+            return self.result('TIMEOUT', actions, num_steps)
+        if num_steps < len(array):
+            raise AssertionError('Action must be withing +- 5 in both dimensions')
+        # The player ran out of actions
+        return 'GAME OVER', actions[:num_steps]
+
+    def result(self, status, actions, num_steps):
+        if num_steps >= self.max_steps:
+            status = 'TIMEOUT'
+        return status, actions[:num_steps]
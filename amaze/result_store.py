@@ -0,0 +1,127 @@
+'''
+Content addressed store of replay results.
+
+A result is keyed by the hash of the level spec, the actions and the engine version, so resubmitted actions of
+a level are not simulated again. Results are kept in an SQLite database, which can be shared by concurrent
+evaluator processes. The least recently used results are evicted when the store grows beyond its size.
+'''
+import contextlib
+import hashlib
+import json
+import sqlite3
+import time
+import numpy as np
+from amaze.collision import in_range
+from amaze.engine import Engine
+from amaze.maze.cache import level_key
+
+# Results are evicted until the store is back at this fraction of its size, so eviction does not run on every put
+EVICT_FRACTION = 0.9
+
+
+def result_key(level, actions, max_steps, version=Engine.VERSION):
+    '''
+    :return: hash of the level spec, the actions and everything else that decides the outcome of a replay. The
+             same actions get the same key in every integer dtype. None unless all actions are integers within
+             +- MAX_ACTION, a cast to one dtype could make other actions look like valid ones.
+    '''
+    array = np.asarray(actions) if len(actions) else np.zeros((0, 2), dtype=np.int64)
+    if array.ndim != 2 or array.shape[1] != 2 or not np.issubdtype(array.dtype, np.integer) or \
+            not np.all(in_range(array)):
+        return None
+    digest = hashlib.sha256()
+    digest.update(level_key(level).encode('utf-8'))
+    digest.update(f':{max_steps}:{version}:'.encode('utf-8'))
+    digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+class ResultStore(object):
+    '''
+    SQLite store of (status, actions) per result key with least recently used eviction
+
+    The number of results is kept in the database by triggers, so a put only has to evict when it is over
+    max_size, without counting the results.
+    '''
+    def __init__(self, filename, max_size=100000, timeout=60):
+        '''
+        :param max_size: maximum number of results kept
+        :param timeout: seconds to wait for another process holding the database lock
+        '''
+        assert max_size > 0, 'max_size must be positive'
+        self.filename = filename
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connection = sqlite3.connect(filename, timeout=timeout, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.transaction():
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, '
+                                    'status TEXT NOT NULL, actions TEXT NOT NULL, last_used REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS size (count INTEGER NOT NULL)')
+            self.connection.execute('INSERT INTO size SELECT COUNT(*) FROM results '
+                                    'WHERE NOT EXISTS (SELECT * FROM size)')
+            self.connection.execute('CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results '
+                                    'BEGIN UPDATE size SET count = count + 1; END')
+            self.connection.execute('CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results '
+                                    'BEGIN UPDATE size SET count = count - 1; END')
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''
+        Holds the write lock of the database, so other processes see all or none of the changes
+        '''
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def get(self, key):
+        '''
+        :return: the stored (status, actions) or None
+        '''
+        row = self.connection.execute('SELECT status, actions FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def put(self, key, result):
+        status, actions = result
+        actions = json.dumps(np.asarray(actions, dtype=np.int64).reshape(-1, 2).tolist(), separators=(',', ':'))
+        with self.transaction():
+            # An upsert instead of INSERT OR REPLACE, whose delete of the old row does not run the trigger
+            self.connection.execute('INSERT INTO results VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                                    'status = excluded.status, actions = excluded.actions, '
+                                    'last_used = excluded.last_used', (key, status, actions, time.time()))
+            if len(self) > self.max_size:
+                self.evict(int(self.max_size * EVICT_FRACTION))
+
+    def evict(self, size):
+        '''
+        Removes the least recently used results until at most size are left
+        '''
+        self.connection.execute('DELETE FROM results WHERE rowid IN '
+                                '(SELECT rowid FROM results ORDER BY last_used LIMIT ?)', (max(0, len(self) - size),))
+
+    def __len__(self):
+        return self.connection.execute('SELECT count FROM size').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        # Every process opens its own connection to the database
+        return {'filename': self.filename, 'max_size': self.max_size, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -0,0 +1,291 @@
+'''
+Local evaluation service.
+
+Submissions are sent over TCP as one line of JSON each, the service replays their levels on a process pool and
+streams a line of JSON back for every level as soon as it is finished, followed by the stats of the submission:
+
+    -> {"client": "alice", "actions": [{"level": 0, "actions": [[1, 0], ...]}, ...]}
+    <- {"level": 3, "status": "YOU WON", "num_actions": 412, "time": 0.02}
+    <- ...
+    <- {"stats": {"num_success": 61, "total_actions": 25310}, "latency": 4.2}
+
+    -> {"metrics": true}
+    <- {"queued_levels": 120, "running_levels": 4, "clients": {"alice": 120}, ...}
+
+Levels are dispatched to the pool round robin over the clients with queued levels, so a large submission does not
+hold up the others. A submission waits before it is queued while more than max_queued levels are, which stops
+reading from its connection. The metrics have the queue depth and histograms of the time submissions waited to
+be queued, the time levels waited in the queue, the time they ran and the latency of whole submissions.
+
+    python -m amaze.service serve --levels resource/levels.txt --workers 4
+    python -m amaze.service submit actions.json --client alice
+'''
+import argparse
+import asyncio
+import collections
+import json
+import signal
+import sys
+import time
+import numpy as np
+from amaze.evaluate import Evaluator
+from amaze.maze.cache import MazeCache
+from amaze.profiler import PhaseTimer
+from amaze.result_store import ResultStore
+
+PORT = 8765
+# Longest request line, a submission of all levels fits in one line
+LINE_LIMIT = 2**28
+
+
+class Submission(object):
+    def __init__(self, client, actions_list):
+        self.client = client
+        self.actions_list = actions_list
+        self.start = time.perf_counter_ns()
+        self.queued = None
+        # Result entries in the order the levels finish
+        self.results = asyncio.Queue()
+
+
+class EvaluationService(object):
+    '''
+    Queues the levels of submissions per client and replays them on the process pool of an Evaluator
+    '''
+    def __init__(self, evaluator, levels, max_queued=10000):
+        '''
+        :param evaluator: Evaluator whose workers replay the levels, see Evaluator.create_pool
+        :param levels: all levels, submissions refer to them by index
+        :param max_queued: number of queued levels before new submissions wait, larger submissions are only
+                           queued when nothing else is
+        '''
+        self.evaluator = evaluator
+        self.levels = levels
+        self.max_queued = max_queued
+        self.pool = None
+        # Queued (submission, actions) of every client with queued levels, in round robin order
+        self.queues = collections.OrderedDict()
+        self.queued = 0
+        self.running = 0
+        self.num_submissions = 0
+        self.num_levels = 0
+        self.timer = PhaseTimer()
+        self.changed = None
+
+    def validate(self, actions_list):
+        levels = [actions['level'] for actions in actions_list]
+        assert len(set(levels)) == len(levels), 'You can only play each level once'
+        assert all(0 <= level < len(self.levels) for level in levels), 'Unknown level'
+
+    async def submit(self, client, actions_list):
+        '''
+        Queues the levels of a submission, waits while too many levels are queued
+
+        :return: the Submission, its results are put in submission.results
+        '''
+        self.validate(actions_list)
+        submission = Submission(client, actions_list)
+        async with self.changed:
+            await self.changed.wait_for(
+                lambda: self.queued == 0 or self.queued + len(actions_list) <= self.max_queued)
+            queue = self.queues.setdefault(client, collections.deque())
+            queue.extend((submission, actions) for actions in actions_list)
+            self.queued += len(actions_list)
+            self.num_submissions += 1
+            submission.queued = time.perf_counter_ns()
+            self.timer.add('admission', submission.queued - submission.start)
+            self.changed.notify_all()
+        return submission
+
+    async def cancel(self, submission):
+        '''
+        Drops the queued levels of a submission, levels already running are finished
+        '''
+        async with self.changed:
+            queue = self.queues.get(submission.client, ())
+            remaining = collections.deque(task for task in queue if task[0] is not submission)
+            self.queued -= len(queue) - len(remaining)
+            if remaining:
+                self.queues[submission.client] = remaining
+            else:
+                self.queues.pop(submission.client, None)
+            self.changed.notify_all()
+
+    def next_task(self):
+        client, queue = next(iter(self.queues.items()))
+        task = queue.popleft()
+        # The client goes to the back of the round robin
+        del self.queues[client]
+        if queue:
+            self.queues[client] = queue
+        return task
+
+    async def dispatch(self):
+        '''
+        Starts a queued level whenever a worker is free
+        '''
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.queued and self.running < self.evaluator.workers)
+                submission, actions = self.next_task()
+                self.queued -= 1
+                self.running += 1
+                self.changed.notify_all()
+            asyncio.get_running_loop().create_task(self.run_level(submission, actions))
+
+    async def run_level(self, submission, actions):
+        self.timer.add('queue_wait', time.perf_counter_ns() - submission.queued)
+        start = time.perf_counter_ns()
+        index = actions['level']
+        future = self.evaluator.submit_replay(self.pool, self.levels[index], actions['actions'], index)
+        try:
+            (status, played), seconds, _ = await asyncio.wrap_future(future)
+            entry = {'level': index, 'status': status, 'num_actions': len(played), 'time': seconds}
+        except Exception as e:
+            entry = {'level': index, 'status': 'ERROR', 'num_actions': 0, 'error': repr(e)}
+        self.timer.add('level', time.perf_counter_ns() - start)
+        async with self.changed:
+            self.running -= 1
+            self.num_levels += 1
+            self.changed.notify_all()
+        await submission.results.put(entry)
+
+    async def results(self, submission):
+        '''
+        :return: async iterator over the result entries of a submission as they finish
+        '''
+        for _ in submission.actions_list:
+            yield await submission.results.get()
+        self.timer.add('submission', time.perf_counter_ns() - submission.start)
+
+    def metrics(self):
+        return {
+            'queued_levels': self.queued,
+            'running_levels': self.running,
+            'workers': self.evaluator.workers,
+            'clients': {client: len(queue) for client, queue in self.queues.items()},
+            'submissions': self.num_submissions,
+            'finished_levels': self.num_levels,
+            'latency': self.timer.report(),
+        }
+
+    async def handle(self, reader, writer):
+        '''
+        Serves the requests of one connection, one after the other
+        '''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('A request must be a JSON object')
+                    if request.get('metrics'):
+                        await self.send(writer, self.metrics())
+                        continue
+                    submission = await self.submit(str(request['client']), request['actions'])
+                except (ValueError, KeyError, TypeError, AssertionError) as e:
+                    await self.send(writer, {'error': repr(e)})
+                    continue
+                try:
+                    entries = []
+                    async for entry in self.results(submission):
+                        entries.append(entry)
+                        await self.send(writer, entry)
+                    await self.send(writer, {'stats': self.evaluator.summarize(entries),
+                                             'latency': (time.perf_counter_ns() - submission.start) / 1e9})
+                except ConnectionError:
+                    await self.cancel(submission)
+                    raise
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, message):
+        writer.write(json.dumps(message).encode('utf-8') + b'\n')
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=PORT):
+        '''
+        Serves until interrupted or terminated, then waits for the running levels
+        '''
+        loop = asyncio.get_running_loop()
+        self.changed = asyncio.Condition()
+        stopped = loop.create_future()
+        loop.add_signal_handler(signal.SIGTERM, stopped.set_result, None)
+        with self.evaluator.create_pool() as self.pool:
+            # Start the workers before listening, so they do not inherit the socket
+            self.pool.submit(int).result()
+            dispatcher = loop.create_task(self.dispatch())
+            try:
+                async with await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT):
+                    await stopped
+            finally:
+                dispatcher.cancel()
+
+
+async def request(host, port, message):
+    '''
+    Sends one request to a service
+
+    :return: async iterator over the reply lines, decoded
+    '''
+    reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+    try:
+        writer.write(json.dumps(message).encode('utf-8') + b'\n')
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            reply = json.loads(line)
+            yield reply
+            if 'level' not in reply:
+                return
+    finally:
+        writer.close()
+
+
+async def print_replies(host, port, message):
+    async for reply in request(host, port, message):
+        print(json.dumps(reply))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='Run the service')
+    serve.add_argument('--levels', default='resource/levels.txt')
+    serve.add_argument('--workers', type=int, default=1, help='Number of processes replaying levels')
+    serve.add_argument('--max-queued', type=int, default=10000,
+                       help='Number of queued levels before new submissions have to wait')
+    serve.add_argument('--maze-cache', default=None, help='Directory for caching generated mazes')
+    serve.add_argument('--result-store', default=None, help='SQLite file of replay results, see amaze.evaluate')
+    submit = commands.add_parser('submit', help='Submit an actions file and print the results as they arrive')
+    submit.add_argument('actions', help='JSON actions file or action log')
+    submit.add_argument('--client', default='anonymous', help='Name the service schedules the submission under')
+    commands.add_parser('metrics', help='Print the queue depth and latencies of the service')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        maze_cache = MazeCache(args.maze_cache) if args.maze_cache else None
+        result_store = ResultStore(args.result_store) if args.result_store else None
+        evaluator = Evaluator(False, maze_cache=maze_cache, workers=args.workers, result_store=result_store)
+        service = EvaluationService(evaluator, evaluator.load_levels(args.levels), args.max_queued)
+        print(f'Serving on {args.host}:{args.port}', file=sys.stderr)
+        asyncio.run(service.serve(args.host, args.port))
+    elif args.command == 'submit':
+        actions_list = [{'level': int(actions['level']), 'actions': np.asarray(actions['actions']).tolist()}
+                        for actions in Evaluator(False).load_actions_list(args.actions)]
+        asyncio.run(print_replies(args.host, args.port, {'client': args.client, 'actions': actions_list}))
+    else:
+        asyncio.run(print_replies(args.host, args.port, {'metrics': True}))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 import numpy as np
+from typing import Union
+from amaze.collision import PackedMask
 
 MazeImage = np.array
-MazeMask = np.array
+# The shipped mazes return a PackedMask, other scenes may return a uint8 array
+MazeMask = Union[np.ndarray, PackedMask]
 StartPos = np.array
 Position = np.array
 GoalPos = np.array
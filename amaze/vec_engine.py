@@ -0,0 +1,145 @@
+import collections
+import numpy as np
+from amaze.collision import exact_collisions, in_range
+from amaze.engine import Canvas, Engine, create_sprite
+from amaze.maze import factory as maze_factory
+
+
+class VecEngine(object):
+    '''
+    Steps N independent levels at once.
+
+    Environment i starts on level i (modulo the number of levels). When an environment finishes it is reset to
+    the next level that has not been played yet. The masks of all environments are stacked into one array,
+    padded with walls to a common size, so collision and goal checks are array operations over all environments.
+    '''
+    PLAYER_RADIUS = Engine.PLAYER_RADIUS
+
+    def __init__(self, levels, num_envs, render=False, max_steps=10000, maze_cache=None, max_generated=128):
+        '''
+        :param levels: list of level specs, as in resource/levels.txt
+        :param render: return a rendered frame for every environment
+        :param max_steps: number of steps before an environment times out
+        :param maze_cache: optional amaze.maze.cache.MazeCache to load generated mazes from
+        :param max_generated: number of generated levels kept in memory, the least recently used are dropped
+        '''
+        assert max_generated > 0, 'max_generated must be positive'
+        self.levels = levels
+        self.num_envs = num_envs
+        self.render_scene = render
+        self.max_steps = max_steps
+        self.maze_cache = maze_cache
+        self.max_generated = max_generated
+        self.generated = collections.OrderedDict()
+        self.initialized = False
+        self.masks = np.full((num_envs, 0, 0), 255, dtype=np.uint8)
+        self.shapes = np.zeros((num_envs, 2), dtype=np.int64)
+        self.pos = np.zeros((num_envs, 2), dtype=np.int64)
+        self.goal = np.zeros((num_envs, 2), dtype=np.int64)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+        self.level = np.zeros(num_envs, dtype=np.int64)
+        self.next_level = 0
+        self.img = [None] * num_envs
+        self.views = None
+        self.canvases = [Canvas() for _ in range(num_envs)]
+        self.louse_sprites = [create_sprite('louse') for _ in range(num_envs)]
+        self.player_sprite = create_sprite('player')
+
+    def generate(self, level):
+        if level in self.generated:
+            self.generated.move_to_end(level)
+            return self.generated[level]
+        if self.maze_cache is not None:
+            generated = self.maze_cache.get(self.levels[level])
+        else:
+            generated = maze_factory(**self.levels[level]).generate()
+        self.generated[level] = generated
+        if len(self.generated) > self.max_generated:
+            self.generated.popitem(last=False)
+        return generated
+
+    def reset(self, env):
+        '''
+        Moves environment env to the next level
+        '''
+        level = self.next_level % len(self.levels)
+        self.next_level += 1
+        img, mask, pos, goal = self.generate(level)
+        height, width = mask.shape
+        if height > self.masks.shape[1] or width > self.masks.shape[2]:
+            masks = np.full((self.num_envs, max(height, self.masks.shape[1]), max(width, self.masks.shape[2])), 255,
+                            dtype=np.uint8)
+            masks[:, :self.masks.shape[1], :self.masks.shape[2]] = self.masks
+            self.masks = masks
+        self.masks[env] = 255
+        if self.views is not None:
+            self.views[env] = 0
+        self.canvases[env] = Canvas()
+        self.masks[env, :height, :width] = mask
+        self.shapes[env] = mask.shape
+        self.img[env] = img
+        self.pos[env] = pos
+        self.goal[env] = goal
+        self.steps[env] = 0
+        self.level[env] = level
+
+    def forward(self, actions):
+        '''
+        Runs an iteration of the gameloop in every environment
+
+        :param actions: array of shape (N, 2) with the action of every environment. Pass None to initialize.
+        :return: (views, positions, statuses). views is None unless rendering, statuses holds the status
+                 each environment finished with, 'RUNNING' if it did not. Finished environments are reset
+                 and their position is the start of the next level.
+        '''
+        statuses = np.full(self.num_envs, 'RUNNING', dtype=object)
+        if actions is None:
+            assert not self.initialized, "Can't initialize game twice"
+            self.initialized = True
+            for env in range(self.num_envs):
+                self.reset(env)
+        else:
+            actions = self.validate_actions(actions)
+            next_pos = self.pos + actions
+            collided = self.check_collisions(self.pos, next_pos)
+            finished = ~collided & self.check_finished(next_pos, self.goal)
+            self.pos = next_pos
+            self.steps += 1
+            statuses[collided] = 'GAME OVER'
+            statuses[finished] = 'YOU WON'
+            statuses[self.steps >= self.max_steps] = 'TIMEOUT'
+            for env in np.flatnonzero(statuses != 'RUNNING'):
+                self.reset(env)
+
+        views = self.render() if self.render_scene else None
+        return views, self.pos.copy(), statuses
+
+    def validate_actions(self, actions):
+        assert isinstance(actions, np.ndarray), 'Actions must be a numpy array'
+        assert actions.shape == (self.num_envs, 2), 'Actions must have shape (num_envs, 2)'
+        assert np.issubdtype(actions.dtype, np.integer), 'Actions must be integers'
+        assert np.all(in_range(actions)), 'Action must be withing +- 5 in both dimensions'
+        return actions
+
+    def check_collisions(self, pos, next_pos):
+        return exact_collisions(self.masks, pos, next_pos, self.PLAYER_RADIUS, index=np.arange(self.num_envs),
+                                shape=self.shapes)
+
+    def check_finished(self, pos, goal):
+        return np.linalg.norm(pos - goal, axis=-1) < 10
+
+    def render(self):
+        height, width = self.masks.shape[1:]
+        if self.views is None or self.views.shape[1:3] != (height, width):
+            self.views = np.zeros((self.num_envs, height, width, 3), dtype=np.uint8)
+            self.canvases = [Canvas() for _ in range(self.num_envs)]
+        for env, canvas in enumerate(self.canvases):
+            h, w = self.shapes[env]
+            if canvas.buffer is None:
+                canvas.buffer = self.views[env, :h, :w]
+            view = canvas.clear(self.img[env])
+            canvas.mark(self.louse_sprites[env].bounds(view.shape, self.goal[env]))
+            self.louse_sprites[env].draw(view, self.goal[env])
+            canvas.mark(self.player_sprite.bounds(view.shape, self.pos[env]))
+            self.player_sprite.draw(view, self.pos[env])
+        return self.views
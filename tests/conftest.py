@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # Sprites and levels are loaded from paths relative to the repository
+    monkeypatch.chdir(ROOT)
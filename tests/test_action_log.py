@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from amaze.action_log import ActionLog, ActionLogWriter
+from amaze.engine import Engine
+from amaze.maze import factory as maze_factory
+from amaze.race_engine import RaceEngine
+from amaze.replay import ReplayEngine
+from amaze.vec_engine import VecEngine
+
+LEVEL = {'maze': 'SquareMaze', 'maze_args': {'size': [1024, 1024], 'seed': 616636}}
+
+
+def write_log(filename, blocks):
+    with ActionLogWriter(filename) as writer:
+        for level, actions in blocks:
+            writer.write(level, actions)
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / 'actions.alog')
+    write_log(filename, [(3, [[1, 0], [-5, 5]]), (1, [])])
+    log = ActionLog(filename)
+    assert [entry['level'] for entry in log] == [3, 1]
+    assert log.find(3).tolist() == [[1, 0], [-5, 5]]
+    assert log.find(1).shape == (0, 2)
+    assert log.find(2) is None
+
+
+def test_minimum_int8_is_rejected(tmp_path):
+    filename = str(tmp_path / 'actions.alog')
+    write_log(filename, [(0, [[1, 0]]), (1, [[1, 0], [2, 0]])])
+    # The writer refuses -128, craft it into the second action of level 1
+    _, offset, _ = ActionLog(filename).table[1].tolist()
+    with open(filename, 'r+b') as f:
+        f.seek(offset + 2)
+        f.write(np.int8(-128).tobytes())
+
+    log = ActionLog(filename)
+    assert log[0]['actions'].tolist() == [[1, 0]]
+    with pytest.raises(AssertionError, match='out of range'):
+        log[1]
+    with pytest.raises(AssertionError):
+        log.find(1)
+
+
+def test_minimum_int8_action_is_invalid():
+    actions = np.array([[1, 0], [-128, 0]], dtype=np.int8)
+    with pytest.raises(AssertionError, match='withing'):
+        ReplayEngine(maze_factory(**LEVEL), 10000).replay(actions)
+
+    engine = Engine(maze_factory(**LEVEL), visualize=False, render=False)
+    engine.forward(None)
+    with pytest.raises(AssertionError, match='withing'):
+        engine.forward(actions[1])
+
+
+@pytest.mark.parametrize('action', [[5.9, 0], [0, -5.5], [1.0, 0]])
+def test_float_actions_are_invalid(action):
+    action = np.array(action)
+    for collision in ('exact', 'inflated'):
+        engine = Engine(maze_factory(**LEVEL), visualize=False, render=False, collision=collision)
+        engine.forward(None)
+        with pytest.raises(AssertionError, match='integers'):
+            engine.forward(action)
+    assert ReplayEngine(maze_factory(**LEVEL), 10000).replay(action[None]) is None
+
+    engine = VecEngine([LEVEL], 2)
+    engine.forward(None)
+    with pytest.raises(AssertionError, match='integers'):
+        engine.forward(np.stack([action, action]))
+    engine = RaceEngine(maze_factory(**LEVEL), 2, render=False)
+    engine.forward(None)
+    with pytest.raises(AssertionError, match='integers'):
+        engine.forward(np.stack([action, action]))
+
+
+def test_out_of_range_actions_are_not_truncated():
+    engine = VecEngine([LEVEL], 1)
+    engine.forward(None)
+    with pytest.raises(AssertionError, match='withing'):
+        engine.forward(np.array([[6, 0]], dtype=np.int8))
+    engine = RaceEngine(maze_factory(**LEVEL), 1, render=False)
+    engine.forward(None)
+    with pytest.raises(AssertionError, match='withing'):
+        engine.forward(np.array([[-128, 0]], dtype=np.int8))
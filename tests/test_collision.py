@@ -0,0 +1,151 @@
+import json
+import numpy as np
+import pytest
+from amaze.collision import InflatedMask, PackedMask, crop_collision, exact_collisions, swept_collisions
+from amaze.engine import Engine
+from amaze.maze import factory as maze_factory
+
+RADIUS = Engine.PLAYER_RADIUS
+NUM_MOVES = 2000
+# The first level of every maze type in the shipped levels
+LEVEL_INDICES = {'SquareMaze': 0, 'HexagonalMaze': 30, 'CircularMaze': 60}
+
+
+def load_level(index):
+    with open('resource/levels.txt') as f:
+        return json.loads(f.read().splitlines()[index])
+
+
+@pytest.fixture(scope='module', params=list(LEVEL_INDICES))
+def moves(request):
+    '''
+    (level, mask, pos, next_pos, reference) for random moves from positions where the player does not touch a
+    wall, reference is the result of crop_collision
+    '''
+    level = load_level(LEVEL_INDICES[request.param])
+    _, mask, _, _ = maze_factory(**level).generate()
+    rng = np.random.default_rng(LEVEL_INDICES[request.param])
+    height, width = mask.shape
+    pos = rng.integers(RADIUS, min(height, width) - RADIUS, (20 * NUM_MOVES, 2))
+    pos = pos[[not crop_collision(mask, p, p, RADIUS) for p in pos]][:NUM_MOVES]
+    assert len(pos) == NUM_MOVES
+    next_pos = pos + rng.integers(-5, 6, pos.shape)
+    reference = np.array([crop_collision(mask, p, q, RADIUS) for p, q in zip(pos, next_pos)])
+    return level, mask, pos, next_pos, reference
+
+
+def segment_distance(xs, ys, pos, next_pos):
+    '''
+    Distance of the pixels (xs, ys) to the centre line of a move
+    '''
+    d = next_pos - pos
+    t = np.clip(((xs - pos[0]) * d[0] + (ys - pos[1]) * d[1]) / max(1, d @ d), 0, 1)
+    return np.hypot(xs - pos[0] - t * d[0], ys - pos[1] - t * d[1])
+
+
+def documented_difference(mask, pos, next_pos):
+    '''
+    :return: True when a move is one of the cases the InflatedMask docstring lists as different from
+             check_collision
+    '''
+    dx, dy = next_pos - pos
+    if dx * dy < 0 or abs(dx) != abs(dy):
+        return True
+    # A wall in the crop of check_collision farther than the player radius from the centre line
+    x1, y1 = np.minimum(pos, next_pos) - RADIUS
+    x2, y2 = np.maximum(pos, next_pos) + 1 + RADIUS
+    ys, xs = np.nonzero(mask[y1:y2, x1:x2])
+    return bool(np.any(segment_distance(xs + x1, ys + y1, pos, next_pos) > RADIUS))
+
+
+def test_swept_collisions_match_crop_collision(moves):
+    _, mask, pos, next_pos, reference = moves
+    collided, exact = swept_collisions(mask, pos, next_pos, RADIUS)
+    assert exact.mean() > 0.99
+    np.testing.assert_array_equal(collided[exact], reference[exact])
+
+
+def test_exact_collisions_match_crop_collision_at_the_border(moves):
+    _, mask, _, _, _ = moves
+    height, width = mask.shape
+    rng = np.random.default_rng(3)
+    # Moves back from the bottom border, the crop of crop_collision is clipped by the mask border
+    pos = np.stack([rng.integers(RADIUS, width - RADIUS, 500), height - RADIUS + rng.integers(0, RADIUS, 500)], -1)
+    next_pos = pos + np.stack([rng.integers(-5, 6, 500), rng.integers(-5, 0, 500)], -1)
+    _, exact = swept_collisions(mask, pos, next_pos, RADIUS)
+    assert not exact.all()
+    reference = [crop_collision(mask, p, q, RADIUS) for p, q in zip(pos, next_pos)]
+    assert exact_collisions(mask, pos, next_pos, RADIUS).tolist() == reference
+
+
+def test_packed_inflated_mask_matches_inflated_mask(moves):
+    _, mask, pos, next_pos, _ = moves
+    inflated = InflatedMask(mask, RADIUS)
+    packed = InflatedMask(mask, RADIUS, packed=True)
+    assert [inflated.collides(p, q) for p, q in zip(pos, next_pos)] == \
+        [packed.collides(p, q) for p, q in zip(pos, next_pos)]
+
+
+def test_engine_collision_modes(moves):
+    level, mask, pos, next_pos, reference = moves
+    inflated = InflatedMask(mask, RADIUS)
+    for collision, packed in (('exact', False), ('inflated', False), ('inflated', True)):
+        engine = Engine(maze_factory(**level), visualize=False, render=False, collision=collision,
+                        packed_collision=packed)
+        engine.forward(None)
+        results = [engine.check_collision(q - p, p, engine.mask) for p, q in zip(pos, next_pos)]
+        if collision == 'exact':
+            assert results == reference.tolist()
+        else:
+            assert results == [inflated.collides(p, q) for p, q in zip(pos, next_pos)]
+
+
+def test_inflated_mask_differences_are_documented(moves):
+    _, mask, pos, next_pos, reference = moves
+    inflated_mask = InflatedMask(mask, RADIUS)
+    inflated = np.array([inflated_mask.collides(p, q) for p, q in zip(pos, next_pos)])
+    different = np.flatnonzero(inflated != reference)
+    # About 96% of random moves agree, check_collision is the stricter test in most of the others
+    assert len(different) <= 0.06 * NUM_MOVES
+    assert np.mean(reference[different]) >= 0.5
+    dense = np.asarray(mask) > 0
+    assert all(documented_difference(dense, pos[i], next_pos[i]) for i in different)
+
+
+@pytest.fixture(scope='module')
+def packed_mask():
+    # A width that is not a multiple of 8, so the last byte of every row is only partly used
+    mask = np.random.default_rng(1).integers(0, 2, (37, 53), dtype=np.uint8) * 255
+    return mask, PackedMask.pack(mask)
+
+
+def test_packed_mask_slices_match_mask(packed_mask):
+    mask, packed = packed_mask
+    expected = (mask > 0).astype(np.uint8)
+    np.testing.assert_array_equal(np.asarray(packed), expected)
+    for start in range(0, 17):
+        # Offsets into the first and second byte, lengths within one byte and across several, stops past the end
+        for stop in (start, start + 1, start + 7, start + 9, 45, 53, 60):
+            for ys in (slice(3, 11), slice(None), 5, slice(30, 40)):
+                np.testing.assert_array_equal(packed[ys, start:stop], expected[ys, start:stop])
+    np.testing.assert_array_equal(packed[4:9, -10:], expected[4:9, -10:])
+
+
+def test_packed_mask_fancy_indexing_matches_mask(packed_mask):
+    mask, packed = packed_mask
+    expected = (mask > 0).astype(np.uint8)
+    rng = np.random.default_rng(2)
+    ys, xs = rng.integers(0, 37, (4, 20)), rng.integers(0, 53, (4, 20))
+    np.testing.assert_array_equal(packed[ys, xs], expected[ys, xs])
+    np.testing.assert_array_equal(packed[ys[0, :, None], xs[0]], expected[ys[0, :, None], xs[0]])
+    np.testing.assert_array_equal(packed[2:6, xs[0]], expected[2:6, xs[0]])
+
+
+def test_packed_mask_rows_match_mask(packed_mask):
+    mask, packed = packed_mask
+    expected = (mask > 0).astype(np.uint8)
+    np.testing.assert_array_equal(packed[7], expected[7])
+    np.testing.assert_array_equal(packed[-1], expected[-1])
+    np.testing.assert_array_equal(packed[10:20], expected[10:20])
+    with pytest.raises(AssertionError):
+        packed[1, 2, 3]
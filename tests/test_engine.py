@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from amaze.engine import Engine
+from amaze.maze import factory as maze_factory
+from amaze.race_engine import RaceEngine
+
+LEVEL = {'maze': 'SquareMaze', 'maze_args': {'size': [1024, 1024], 'seed': 616636}}
+
+
+class LegacyScene(object):
+    '''
+    Scene without static or version that changes img and mask in place in every update()
+    '''
+    def __init__(self, copy=False):
+        '''
+        :param copy: return copies from update(), which any engine redraws in full
+        '''
+        self.maze = maze_factory(**LEVEL)
+        self.copy = copy
+        self.steps = 0
+        self.wall = None
+
+    def generate(self):
+        img, mask, startpos, goalpos = self.maze.generate()
+        self.img = np.array(img)
+        self.mask = np.array(np.asarray(mask))
+        return self.img, self.mask, startpos, goalpos
+
+    def update(self):
+        self.steps += 1
+        self.img[:60, :60] = 40 * self.steps % 256
+        if self.wall is not None:
+            x, y = self.wall
+            self.mask[y - 2:y + 3, x - 2:x + 3] = 255
+        if self.copy:
+            return self.img.copy(), self.mask.copy()
+        return self.img, self.mask
+
+
+def test_legacy_scene_changed_in_place_is_redrawn():
+    engine = Engine(LegacyScene(), visualize=False, render=True)
+    reference = Engine(LegacyScene(copy=True), visualize=False, render=True)
+    np.testing.assert_array_equal(engine.forward(None)[0], reference.forward(None)[0])
+    for _ in range(5):
+        action = np.array([0, 0])
+        np.testing.assert_array_equal(engine.forward(action)[0], reference.forward(action)[0])
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_legacy_scene_changed_in_place_rebuilds_inflated_mask(packed):
+    scene = LegacyScene()
+    engine = Engine(scene, visualize=False, render=False, collision='inflated', packed_collision=packed)
+    _, pos, _ = engine.forward(None)
+    assert engine.forward(np.array([0, 0]))[2] == 'RUNNING'
+    scene.wall = pos
+    assert engine.forward(np.array([0, 0]))[2] == 'GAME OVER'
+
+
+def test_race_legacy_scene_changed_in_place_is_redrawn():
+    engine = RaceEngine(LegacyScene(), 2)
+    reference = RaceEngine(LegacyScene(copy=True), 2)
+    np.testing.assert_array_equal(engine.forward(None)[0], reference.forward(None)[0])
+    for _ in range(5):
+        actions = np.zeros((2, 2), dtype=np.int64)
+        np.testing.assert_array_equal(engine.forward(actions)[0], reference.forward(actions)[0])
@@ -0,0 +1,51 @@
+import hashlib
+import numpy as np
+import pytest
+from amaze.maze import factory as maze_factory
+from amaze.maze.cache import MazeCache
+from tests.test_collision import load_level
+
+# sha256 of img and of np.asarray(mask) > 0 of shipped levels, generated by the baseline generators. The same
+# seed must give a bit-identical maze, or replayed actions and cached levels no longer match.
+LEVEL_HASHES = {
+    0: ('1ae20646969d189ef2b801894c5af1b5a677b2e022c86d81580980ea16fbaca6',
+        '993ae8b79064e5e0fc109bce0b35c9db82eb27c0dd7463fbbf6d371007899e9c', [45, 20], [1008, 1024]),
+    15: ('ea20836ea791e129064b548c2a0c3c240229133848d2d41622f4dc9de2165b31',
+         '6b44913a804f9fdd14f5d2047007c475c9acac50a09b387a1858f76c21136669', [45, 20], [1008, 1024]),
+    29: ('954e30374ec228487893c2e870a8c4dda4a538455dd77d5159c39d0f8b14b101',
+         'cbec920214a5d772609ae3b5b141d03bd85b30996562628a100eb12901041760', [45, 20], [1008, 1024]),
+    30: ('64d49056d8926d84359632be5bba229a0b0b74f13dfcef5a67a09ff8e2c7fcce',
+         'e14bf6816cc66ade9fa2e46f6c5678ff1c925d322852792a13514063d2f63426', [142, 380], [40, 142]),
+    45: ('c4d84235821489f2977f773628f80861c68a5b3ce5dc28e25e67821ba0590e89',
+         'e96e54d46beb46252a92004c9310779c9cb8df784ba437a3e6d5408ad17bae5d', [550, 481], [958, 380]),
+    59: ('b9d394ce9e7e9ee346e2b0011b5fedd2883e05b7959ac513c5d84628505a63f8',
+         '3d5d14c744cbc59a2316a087e2e2940bd786241861e851c9dfd266e175edfaaf', [244, 142], [244, 958]),
+    60: ('9e70b973ec0518f5e83cbd05bce62c95114660795ff039fc822f493e0d4a0882',
+         'b5a4196e54eb5b1daeaf1729b01adca060fb72bb6636ff83effe7d34ff763207', [890, 217], [512, 512]),
+    75: ('f71c2162b5e30104096ef81a85936b70f3a88223546b2d912892fdac80cd4860',
+         '98d7125b3133a055f340c07929a5c0852035b64e3ef074cbf01814c159a8b780', [33, 501], [512, 512]),
+    89: ('833973fdaf7c0a50480f2d66c26fbe4b6194d6d5ac45fe14b9b81868d79f4507',
+         'a75fe1bbe43a09404c8e9a0759604584b66a6fdfd91dff0926cad84a4327030f', [36, 454], [512, 512]),
+}
+
+
+def sha256(array):
+    return hashlib.sha256(np.ascontiguousarray(array).tobytes()).hexdigest()
+
+
+@pytest.mark.parametrize('index', list(LEVEL_HASHES))
+@pytest.mark.parametrize('cached', [False, True])
+def test_mazes_are_bit_identical(index, cached, tmp_path):
+    img_hash, mask_hash, startpos, goalpos = LEVEL_HASHES[index]
+    if cached:
+        # Stored on the first get, loaded from the cache files on the second
+        cache = MazeCache(str(tmp_path))
+        cache.get(load_level(index))
+        img, mask, start, goal = cache.get(load_level(index))
+    else:
+        img, mask, start, goal = maze_factory(**load_level(index)).generate()
+    assert np.asarray(img).dtype == np.uint8
+    assert sha256(img) == img_hash
+    assert sha256(np.asarray(mask) > 0) == mask_hash
+    assert np.asarray(start).tolist() == startpos
+    assert np.asarray(goal).tolist() == goalpos
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from amaze.evaluate import Evaluator
+from amaze.maze import factory as maze_factory
+from amaze.player.keyboardwarrior import ActionRePlayer
+from amaze.player.solver import Solver
+from amaze.replay import ReplayEngine
+from tests.test_collision import LEVEL_INDICES, load_level
+
+# The shipped circular levels can not be solved at the player radius, see MAZE_ARGS in amaze.build_levels
+SOLVED_LEVELS = [load_level(LEVEL_INDICES['SquareMaze']), load_level(LEVEL_INDICES['HexagonalMaze'])]
+
+
+@pytest.fixture(scope='module', params=range(len(SOLVED_LEVELS)))
+def solved(request):
+    level = SOLVED_LEVELS[request.param]
+    return level, Solver().solve(maze_factory(**level))
+
+
+def step_by_step(level, actions, max_steps=Evaluator.MAX_STEPS):
+    '''
+    :return: (status, actions) of the Engine.forward loop of the evaluator
+    '''
+    evaluator = Evaluator(False)
+    evaluator.MAX_STEPS = max_steps
+    return evaluator.evaluate_level(level, ActionRePlayer(actions), render=False)
+
+
+def vectorized(level, actions, max_steps=Evaluator.MAX_STEPS, chunk_size=ReplayEngine.CHUNK_SIZE):
+    engine = ReplayEngine(maze_factory(**level), max_steps)
+    engine.CHUNK_SIZE = chunk_size
+    return engine.replay(actions)
+
+
+def assert_same_result(level, actions, max_steps=Evaluator.MAX_STEPS, chunk_size=ReplayEngine.CHUNK_SIZE):
+    status, played = step_by_step(level, actions, max_steps)
+    result = vectorized(level, actions, max_steps, chunk_size)
+    assert result is not None
+    assert (result[0], np.asarray(result[1]).tolist()) == (status, np.asarray(played).reshape(-1, 2).tolist())
+    return status
+
+
+def test_solver_path_wins(solved):
+    level, actions = solved
+    assert assert_same_result(level, actions) == 'YOU WON'
+    # Winning in the last step of a chunk and in the first step of the next one
+    for chunk_size in (len(actions), len(actions) - 1, 7):
+        assert assert_same_result(level, actions, chunk_size=chunk_size) == 'YOU WON'
+
+
+def test_max_steps_boundary(solved):
+    level, actions = solved
+    # Winning in the last allowed step is a timeout, in the one before it is not
+    assert assert_same_result(level, actions, max_steps=len(actions)) == 'TIMEOUT'
+    assert assert_same_result(level, actions, max_steps=len(actions) + 1) == 'YOU WON'
+    # Standing still until the limit, and one action less or more than it
+    for num_actions in (19, 20, 21):
+        expected = 'TIMEOUT' if num_actions >= 20 else 'GAME OVER'
+        assert assert_same_result(level, [[0, 0]] * num_actions, max_steps=20) == expected
+
+
+def test_empty_actions(solved):
+    level, _ = solved
+    assert assert_same_result(level, []) == 'GAME OVER'
+
+
+def test_invalid_action_after_collision(solved):
+    level, _ = solved
+    # Straight up into a wall, the invalid action is never played
+    actions = [[0, -5]] * 10 + [[6, 0], [0, 0]]
+    assert assert_same_result(level, actions) == 'GAME OVER'
+
+
+def test_invalid_action_before_collision(solved):
+    level, actions = solved
+    actions = actions[:3] + [[6, 0]] + actions[3:]
+    with pytest.raises(AssertionError):
+        step_by_step(level, actions)
+    with pytest.raises(AssertionError):
+        vectorized(level, actions)
+
+
+def test_perturbed_solver_paths(solved):
+    level, actions = solved
+    rng = np.random.default_rng(0)
+    statuses = set()
+    for _ in range(10):
+        perturbed = np.clip(np.array(actions) + rng.integers(-1, 2, (len(actions), 2)), -5, 5)
+        statuses.add(assert_same_result(level, perturbed.tolist()))
+    assert 'GAME OVER' in statuses
+
+
+def test_unsolvable_circular_level():
+    level = load_level(LEVEL_INDICES['CircularMaze'])
+    assert assert_same_result(level, [[0, 0], [1, 1]]) == 'GAME OVER'
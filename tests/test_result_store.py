@@ -0,0 +1,76 @@
+import sqlite3
+import numpy as np
+import pytest
+from amaze.evaluate import Evaluator
+from amaze.result_store import EVICT_FRACTION, ResultStore, result_key
+
+LEVEL = {'maze': 'SquareMaze', 'maze_args': {'size': [1024, 1024], 'seed': 616636}}
+
+
+def count(filename):
+    with sqlite3.connect(filename) as connection:
+        return connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+def test_key_depends_on_actions_and_engine():
+    key = result_key(LEVEL, [[1, 0]], 10000)
+    assert key == result_key(dict(LEVEL, extra=1), np.array([[1, 0]], dtype=np.int8), 10000)
+    assert key != result_key(LEVEL, [[0, 1]], 10000)
+    assert key != result_key(LEVEL, [[1, 0]], 100)
+    assert key != result_key(LEVEL, [[1, 0]], 10000, version=-1)
+    assert result_key(LEVEL, [], 10000) == result_key(LEVEL, np.zeros((0, 2), dtype=np.int8), 10000)
+
+
+@pytest.mark.parametrize('actions', [[[2.5, 0]], [[2, 0], [1.0, 0]], [[6, 0]], np.array([[-128, 0]], dtype=np.int8),
+                                     np.array([[2**64 - 1, 0]], dtype=np.uint64), [[1, 0, 0]]])
+def test_invalid_actions_have_no_key(actions):
+    assert result_key(LEVEL, actions, 10000) is None
+
+
+def test_actions_without_key_are_not_stored(tmp_path):
+    filename = str(tmp_path / 'results.db')
+    with ResultStore(filename) as store:
+        evaluator = Evaluator(False, result_store=store)
+        assert evaluator.replay_level(LEVEL, [[2, 0]])[0] == 'GAME OVER'
+        # A stored [[2, 0]] must not be returned for [[2.5, 0]]
+        with pytest.raises(AssertionError, match='integers'):
+            evaluator.replay_level(LEVEL, [[2.5, 0]])
+        assert len(store) == 1
+
+
+def test_get_put(tmp_path):
+    with ResultStore(str(tmp_path / 'results.db')) as store:
+        assert store.get('a') is None
+        store.put('a', ('YOU WON', np.array([[1, 0], [0, 1]])))
+        assert store.get('a') == ('YOU WON', [[1, 0], [0, 1]])
+        store.put('a', ('GAME OVER', []))
+        assert store.get('a') == ('GAME OVER', [])
+        assert len(store) == 1
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    filename = str(tmp_path / 'results.db')
+    with ResultStore(filename, max_size=10) as store:
+        for i in range(10):
+            store.put(str(i), ('GAME OVER', []))
+        # Using 0 makes 1 the least recently used
+        store.get('0')
+        store.put('10', ('GAME OVER', []))
+        assert len(store) == count(filename) == int(10 * EVICT_FRACTION)
+        assert store.get('0') is not None and store.get('1') is None and store.get('10') is not None
+
+
+def test_size_is_shared_between_stores(tmp_path):
+    filename = str(tmp_path / 'results.db')
+    first = ResultStore(filename, max_size=5)
+    second = ResultStore(filename, max_size=5)
+    for i in range(5):
+        (first if i % 2 else second).put(str(i), ('GAME OVER', []))
+    assert len(first) == len(second) == count(filename) == 5
+    second.put('5', ('GAME OVER', []))
+    assert len(first) == count(filename) == int(5 * EVICT_FRACTION)
+    first.close()
+    second.close()
+    # The count of an existing database is kept when it is opened again
+    with ResultStore(filename) as store:
+        assert len(store) == count(filename)
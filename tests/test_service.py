@@ -0,0 +1,55 @@
+import asyncio
+import json
+import pytest
+from amaze.evaluate import Evaluator
+from amaze.service import EvaluationService, LINE_LIMIT
+
+
+async def with_service(function, workers=1):
+    '''
+    Runs function(service, reader, writer) with a connection to a service on a free port
+    '''
+    evaluator = Evaluator(False, workers=workers)
+    service = EvaluationService(evaluator, evaluator.load_levels('resource/levels.txt'))
+    service.changed = asyncio.Condition()
+    with evaluator.create_pool() as service.pool:
+        dispatcher = asyncio.get_running_loop().create_task(service.dispatch())
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0, limit=LINE_LIMIT)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=LINE_LIMIT)
+        try:
+            return await function(service, reader, writer)
+        finally:
+            writer.close()
+            dispatcher.cancel()
+            server.close()
+            await server.wait_closed()
+
+
+async def send(reader, writer, line):
+    writer.write(line.encode('utf-8') + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+@pytest.mark.parametrize('line', ['[1, 2]', '"x"', '3', 'null', '{"client": "a"}', 'not json'])
+def test_bad_requests_get_an_error_reply(line):
+    async def run(service, reader, writer):
+        reply = await send(reader, writer, line)
+        assert 'error' in reply
+        # The connection is still served
+        assert (await send(reader, writer, '{"metrics": true}'))['queued_levels'] == 0
+    asyncio.run(with_service(run))
+
+
+def test_results_are_streamed():
+    actions = [{'level': level, 'actions': [[0, 0]] * 5} for level in (2, 0)]
+
+    async def run(service, reader, writer):
+        reply = await send(reader, writer, json.dumps({'client': 'a', 'actions': actions}))
+        replies = [reply] + [json.loads(await reader.readline()) for _ in actions]
+        assert sorted(entry['level'] for entry in replies[:2]) == [0, 2]
+        assert all(entry['status'] == 'GAME OVER' and entry['num_actions'] == 5 for entry in replies[:2])
+        assert replies[2]['stats'] == {'num_success': 0, 'total_actions': 10}
+        assert service.metrics()['finished_levels'] == 2
+    asyncio.run(with_service(run))
@@ -0,0 +1,36 @@
+import numpy as np
+from amaze.collision import crop_collision, out_of_bounds, swept_collisions
+from amaze.vec_engine import VecEngine
+from tests.test_collision import LEVEL_INDICES, RADIUS, load_level
+
+LEVELS = [load_level(index) for index in LEVEL_INDICES.values()]
+
+
+def test_generated_levels_are_bounded():
+    engine = VecEngine(LEVELS, 1, max_generated=2)
+    for level in (0, 1, 0, 2):
+        engine.generate(level)
+    # 1 is the least recently used when 2 is generated
+    assert list(engine.generated) == [0, 2]
+
+
+def test_collisions_match_crop_collision_at_the_border():
+    engine = VecEngine(LEVELS, len(LEVELS))
+    engine.forward(None)
+    index = np.arange(len(LEVELS))
+    masks = [engine.masks[env, :height, :width] for env, (height, width) in enumerate(engine.shapes)]
+    rng = np.random.default_rng(0)
+    num_collided = 0
+    for _ in range(200):
+        # Moves back from the right border, the crop of crop_collision is clipped by the mask border
+        width = engine.shapes[:, 1]
+        pos = np.stack([width - RADIUS + rng.integers(0, RADIUS, len(LEVELS)),
+                        rng.integers(RADIUS, engine.shapes[:, 0] - RADIUS)], axis=-1)
+        next_pos = pos + np.stack([rng.integers(-5, 0, len(LEVELS)), rng.integers(-5, 6, len(LEVELS))], axis=-1)
+        _, exact = swept_collisions(engine.masks, pos, next_pos, RADIUS, index=index, shape=engine.shapes)
+        reference = [crop_collision(mask, p, q, RADIUS) for mask, p, q in zip(masks, pos, next_pos)]
+        assert engine.check_collisions(pos, next_pos).tolist() == reference
+        num_collided += sum(reference)
+        assert not np.any(exact & ~out_of_bounds(next_pos, engine.shapes, RADIUS))
+    # The padding of the stacked masks would make every one of these moves collide
+    assert num_collided < 200 * len(LEVELS)